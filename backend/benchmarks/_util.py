@@ -0,0 +1,26 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure(run, runs: int, concurrency: int = 1) -> list:
+    """Milliseconds taken by each of `runs` calls to `run`, `concurrency` at a time"""
+    def timed(_):
+        start = time.perf_counter()
+        run()
+        return (time.perf_counter() - start) * 1000
+
+    if concurrency == 1:
+        return [timed(i) for i in range(runs)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(timed, range(runs)))
+
+
+def report(name: str, samples: list):
+    print(f"{name:<22} p50 {percentile(samples, 0.50):8.2f} ms   p99 {percentile(samples, 0.99):8.2f} ms   "
+          f"mean {statistics.mean(samples):8.2f} ms")
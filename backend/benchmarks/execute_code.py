@@ -0,0 +1,46 @@
+import argparse
+import time
+
+from backend.benchmarks._util import measure, report
+from backend.sandbox import execute_in_subprocess, python_workers
+
+# Latency of /execute-code's Python path: a fresh interpreter per run vs the
+# warm worker pool.
+#   python -m backend.benchmarks.execute_code --runs 200 --concurrency 4
+
+SAMPLE = """
+n = int(input())
+print(sum(i * i for i in range(n)))
+"""
+
+
+def checked(run):
+    def call():
+        result = run()
+        assert result["success"] and result["output"].strip() == "332833500", result
+    return call
+
+
+def pooled_run():
+    result = python_workers.run(SAMPLE, ["1000"], 5)[0]
+    return {"success": result["exit_code"] == 0, "output": result["output"]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    python_workers.start()
+    time.sleep(0.5)  # let the pre-forked workers finish booting
+
+    print(f"{args.runs} runs, concurrency {args.concurrency}")
+    report("subprocess", measure(checked(lambda: execute_in_subprocess(SAMPLE, "python", "1000")),
+                                 args.runs, args.concurrency))
+    report("warm pool", measure(checked(pooled_run), args.runs, args.concurrency))
+    print(python_workers.stats())
+
+
+if __name__ == "__main__":
+    main()
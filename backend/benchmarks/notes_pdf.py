@@ -0,0 +1,70 @@
+import argparse
+import random
+
+from backend.benchmarks._util import measure, report
+from backend.notes_pdf import create_pdf, markdown_flowables, notes_pdf
+
+# Cost of turning a generated lesson into notes: markdown -> flowables alone,
+# the full ReportLab layout, and a cached re-download. The 4x run checks that
+# conversion stays linear in lesson length.
+#   python -m backend.benchmarks.notes_pdf --kb 30 --runs 20
+
+WORDS = "python list dict loop function value return class object index memory cache <tag> a&b x<y".split()
+
+
+def generate_lesson(size_bytes: int, seed: int = 7) -> str:
+    """Lesson-shaped markdown of about `size_bytes`: headings, prose, lists, code, tables, quotes"""
+    rnd = random.Random(seed)
+    parts = []
+    total = 0
+    section = 0
+    while total < size_bytes:
+        section += 1
+        prose = " ".join(rnd.choice(WORDS) for _ in range(60))
+        block = "\n".join([
+            f"## Section {section}: **Key** ideas",
+            "",
+            f"{prose} with `inline_code()`, *emphasis* and a [link](https://example.com/?a=1&b=2).",
+            "",
+            f"- first point about {rnd.choice(WORDS)}",
+            "- second point with **bold** text",
+            "1. step one",
+            "2. step two",
+            "",
+            "```python",
+            "def check(x):",
+            "    return x < 10 and x & 1",
+            "```",
+            "",
+            "| Name | Value |",
+            "|------|-------|",
+            "| a < b | 1 & 2 |",
+            "| c | 3 |",
+            "",
+            "### Detail",
+            "> quoted text",
+            "",
+        ]) + "\n"
+        parts.append(block)
+        total += len(block)
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kb", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    lesson = generate_lesson(args.kb * 1024)
+    larger = generate_lesson(args.kb * 4 * 1024)
+    print(f"{len(lesson)} byte lesson, {args.runs} runs")
+    report("markdown -> flowables", measure(lambda: markdown_flowables(lesson), args.runs))
+    report("  same, 4x lesson", measure(lambda: markdown_flowables(larger), args.runs))
+    report("create_pdf", measure(lambda: create_pdf(lesson, "Benchmark", "Lesson"), max(1, args.runs // 4)))
+    notes_pdf(lesson, "Benchmark", "Lesson")
+    report("notes_pdf (cached)", measure(lambda: notes_pdf(lesson, "Benchmark", "Lesson"), args.runs))
+
+
+if __name__ == "__main__":
+    main()
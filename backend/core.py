@@ -3,69 +3,111 @@ from langchain_core.prompts import PromptTemplate
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 from dotenv import load_dotenv
 from typing import TypedDict, List, Dict, Any
+import asyncio
 import os
 import re
 import json
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import START, END, StateGraph
-from langgraph.checkpoint.mongodb import MongoDBSaver
-from pymongo import MongoClient
+from backend import db
+from backend.lesson_cache import LessonCache, prompt_cache_key, replay_chunks
+from backend.singleflight import SingleFlight, StreamFanout
+from backend.intent_router import IntentRouter
+from backend.prefetch import PrefetchScheduler
 
 load_dotenv()
 
 MURFAI_API_KEY=os.getenv("MURFAI_API_KEY")
-client = MongoClient(os.getenv("MONGO_CLIENT"))
 
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GENAI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.0-flash')
+MODEL_NAME = 'gemini-2.0-flash'
+model = genai.GenerativeModel(MODEL_NAME)
 
-def gemini_invoke(prompt: str, stream: bool = False):
-    """Generate content from Gemini API with optional streaming"""
-    try:
-        if stream:
-            # Use stream_generate_content for streaming
-            response = model.generate_content(prompt, stream=True)
-            for chunk in response:
-                if chunk.text:
-                    yield chunk.text
-        else:
-            # Use generate_content for non-streaming
-            response = model.generate_content(prompt)
-            return response.text.strip()
-    except Exception as e:
-        print("Gemini API error: ", e)
-        if stream:
-            yield f"Error: {e}"
-        else:
-            return f"Error: {e}"
+# Generated lessons are shared across students: in-process LRU + MongoDB
+lesson_cache = LessonCache(
+    db.lesson_cache,
+    max_bytes=int(os.getenv("LESSON_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+)
+
+# Identical prompts in flight at the same time (e.g. a whole class opening
+# lesson 1 together) share one upstream Gemini call
+inflight_calls = SingleFlight()
+inflight_streams = StreamFanout()
+
+intent_router = IntentRouter()
+
+# Gemini JSON mode: the reply is a bare JSON document, no prose or markdown fences
+JSON_OUTPUT = {"response_mime_type": "application/json"}
 
-def gemini_invoke_simple(prompt: str):
-    """Generate content from Gemini API - non-streaming only, returns string"""
+def is_llm_error(text: str) -> bool:
+    """Gateway helpers report failures in-band as 'Error: ...' strings"""
+    return text.startswith("Error:")
+
+#---------- LLM GATEWAY ------------
+# All Gemini traffic goes through these async helpers so a long generation only
+# holds an awaiting coroutine, never a threadpool worker.
+
+async def _generate(prompt: str, generation_config: dict = None) -> str:
     try:
-        response = model.generate_content(prompt)
+        response = await model.generate_content_async(prompt, generation_config=generation_config)
         return response.text.strip()
     except Exception as e:
         print("Gemini API error: ", e)
         return f"Error: {e}"
 
-def gemini_invoke_list(prompt: str):
-    """Generate content from Gemini API and return as list of chunks"""
-    try:
-        response = model.generate_content(prompt, stream=True)
-        chunks = []
-        for chunk in response:
-            if chunk.text:
-                chunks.append(chunk.text)
-        return chunks
-    except Exception as e:
-        print("Gemini API error: ", e)
-        return [f"Error: {e}"]
+async def gemini_generate(prompt: str, json_mode: bool = False) -> str:
+    """Generate content from Gemini API - non-streaming, returns string.
+    Concurrent calls with the same prompt are coalesced into one request.
+    With json_mode the model is constrained to emit a JSON document."""
+    if json_mode:
+        key = prompt_cache_key(prompt, f"{MODEL_NAME}:json")
+        return await inflight_calls.do(key, lambda: _generate(prompt, JSON_OUTPUT))
+    key = prompt_cache_key(prompt, MODEL_NAME)
+    return await inflight_calls.do(key, lambda: _generate(prompt))
+
+class GeminiStream:
+    """Incremental Gemini text stream.
+
+    Chunks are yielded as soon as the SDK hands them over. Cancelling the task
+    that iterates the stream cancels the upstream call. `on_complete` is awaited
+    with the full text only when the stream ran to completion without error.
+    """
+
+    def __init__(self, prompt: str, on_complete=None):
+        self.prompt = prompt
+        self.on_complete = on_complete
+
+    async def __aiter__(self):
+        try:
+            response = await model.generate_content_async(self.prompt, stream=True)
+            parts = []
+            async for chunk in response:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            print("Gemini API error: ", e)
+            yield f"Error: {e}"
+            return
+        if self.on_complete is not None:
+            await self.on_complete("".join(parts))
 
-saver = MongoDBSaver.from_conn_string(
-    os.getenv("MONGO_CLIENT"),
-    db_name="chatbot_langgraph",
-    collection_name="chatbot_sessions"
-)
+class CachedStream:
+    """Replays cached text with the same interface as a stream subscription"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    async def __aiter__(self):
+        for chunk in replay_chunks(self.text):
+            yield chunk
+
+    def cancel(self):
+        pass
+
+# Tutor sessions are checkpointed per thread_id; idle sessions expire after a week
+saver = db.session_saver("chatbot_sessions", ttl_seconds=int(os.getenv("SESSION_TTL_SECONDS", 7 * 24 * 3600)))
 
 # llm = HuggingFaceEndpoint(
 #     repo_id="Qwen/Qwen3-Coder-480B-A35B-Instruct",
@@ -74,15 +116,19 @@ saver = MongoDBSaver.from_conn_string(
 # model = ChatHuggingFace(llm=llm)
 
 class Agentstate(TypedDict):
+    # Persisted session state - keep it small, it is loaded on every turn
     query: str
-    explanation: str
-    response: str
     mode: str
     topic: str
     syllabus: List[Dict[str, str]]
     current_lesson: int
-    user_performance: Dict[str, Any]
+    syllabus_adapted: bool
     adaptive_recommendations: List[Dict[str, Any]]
+    # Per-turn output, stripped from checkpoints (see session_store.TRANSIENT_KEYS)
+    response: str
+    pending_lesson: int
+
+NAVIGATION_COMMANDS = ("next", "n", "continue", "resume", "prev", "previous", "back", "repeat", "again")
 
 def safe_json_parse(text: str):
     """Try to parse JSON out of model output (robust).
@@ -387,24 +433,61 @@ concept_prompt = PromptTemplate(
     input_variables=["concept"]
 )
 
-def handle_query(state: Agentstate) -> Agentstate:
+async def start_course(state: Agentstate, topic: str, defer: bool = False) -> str:
+    """Generate the syllabus and show lesson 1, pipelining the lesson generations"""
+    state['mode'] = 'course'
+    state['topic'] = topic
+    syllabus = await generate_syllabus(topic)
+    state['syllabus'] = syllabus
+    state['current_lesson'] = 0
+    state['syllabus_adapted'] = False
+    # Lesson 1 starts generating right away (lesson 2 is queued by the
+    # prefetcher once this turn ends); whoever asks for it next (render below,
+    # /lesson-stream) joins the running stream
+    if syllabus:
+        warm_lesson(topic, 0, syllabus[0]['title'])
+    # render syllabus summary + lesson 1
+    syllabus_text = "Syllabus:\n" + "\n".join([f"{i+1}. {s['title']} - {s['summary']}" for i, s in enumerate(syllabus)])
+    lesson_text = await render_lesson(state, 0, defer)
+    response = f"Starting course: {topic}\n\n{syllabus_text}\n\n---\n{lesson_text}"
+    if not defer:
+        response += "\n\nControls: 'next', 'prev', 'repeat', 'goto <n>', 'stop', or ask a concept question."
+    return response
+
+async def handle_query(state: Agentstate, config: RunnableConfig) -> Agentstate:
+    # Streaming callers stream lesson bodies themselves (see main.course_stream)
+    defer = config.get('configurable', {}).get('defer_lessons', False)
     query = state.get('query', '').strip()
     if not query:
         state['response'] = "Please type a question or 'teach me <topic>"
         return state
+
+    # Cheap local routing first; only ambiguous queries pay for LLM classification
+    route = intent_router.route(query)
     
-    if state.get('mode') == 'course' and 'syllabus' in state:
-        cmd = query.lower().strip()
+    # Restored from the session checkpoint: navigation needs no LLM round trip
+    if state.get('mode') in ('course', 'paused') and state.get('syllabus'):
+        if route and route['type'] == 'navigation':
+            cmd = route['command']
+        else:
+            cmd = query.lower().strip()
+        if state.get('mode') == 'paused':
+            if cmd in ("continue", "resume"):
+                state['mode'] = 'course'
+                state['response'] = await render_lesson(state, state.get('current_lesson', 0), defer)
+                return state
+            if cmd in NAVIGATION_COMMANDS or cmd.startswith('goto '):
+                state['mode'] = 'course'
         if cmd in ["next", "n", "continue", "resume"]:
             state["current_lesson"] = min(state.get("current_lesson", 0) + 1, len(state['syllabus']) - 1)
-            state['response'] = render_lesson(state, state['current_lesson'])
+            state['response'] = await render_lesson(state, state['current_lesson'], defer)
             return state
         if cmd in ['prev', "previous", "back"]:
             state['current_lesson'] = max(state.get("current_lesson", 0) - 1, 0)
-            state['response'] = render_lesson(state, state.get('current_lesson', 0))
+            state['response'] = await render_lesson(state, state.get('current_lesson', 0), defer)
             return state
         if cmd in ('repeat', 'again'):
-            state['response'] = render_lesson(state, state.get('current_lesson', 0))
+            state['response'] = await render_lesson(state, state.get('current_lesson', 0), defer)
             return state
         if cmd.startswith('goto '):
             parts = cmd.split()
@@ -412,7 +495,7 @@ def handle_query(state: Agentstate) -> Agentstate:
                 n = int(parts[1])
                 n_idx = max(0, min(n-1, len(state['syllabus'])-1))
                 state['current_lesson'] = n_idx
-                state['response'] = render_lesson(state, n_idx)
+                state['response'] = await render_lesson(state, n_idx, defer)
                 return state
             except Exception:
                 state['response'] = "Could not parse the lesson number. Use 'goto 3' to go to lesson 3."
@@ -422,53 +505,42 @@ def handle_query(state: Agentstate) -> Agentstate:
             state['response'] = "Course paused. Type 'resume' to continue or 'teach me <topic>' to start another course."
             return state
         
-        classification = classify_query(query)
+        classification = route or await classify_query(query)
         if classification['type'] == 'course':
             topic = classification.get('topic') or query
-            state['mode'] = 'course'
-            state['topic'] = topic
-            syllabus = generate_syllabus(topic)
-            state['syllabus'] = syllabus
-            state['current_lesson'] = 0
-            syllabus_text = "Syllabus:\n" + "\n".join([f"{i+1}. {s['title']} - {s['summary']}" for i, s in enumerate(syllabus)])
-            lesson_text = render_lesson(state, 0)
-            state['response'] = f"Starting course: {topic}\n\n{syllabus_text}\n\n---\n{lesson_text}\n\nControls: 'next', 'prev', 'repeat', 'goto <n>', 'stop', or ask a concept question."
+            state['response'] = await start_course(state, topic, defer)
             return state
 
         if classification['type'] == 'concept':
-            explanation = generate_concept_explanation(query)
+            explanation = await generate_concept_explanation(query)
             state['response'] = f"{explanation}/n/n (you are in course '{state.get('topic')}'. Type 'resume' or 'next' to continue the course)"
             return state
         
-        explanation = generate_concept_explanation(query)
+        explanation = await generate_concept_explanation(query)
         state['response'] = explanation
         return state
+
+    if route and route['type'] == 'navigation':
+        state['response'] = "There is no course in progress. Type 'teach me <topic>' to start one."
+        return state
     
-    classification = classify_query(query)
+    classification = route or await classify_query(query)
     if classification['type'] == 'course':
         topic = classification.get('topic') or query
-        state['mode'] = 'course'
-        state['topic'] = topic
-        syllabus = generate_syllabus(topic)
-        state['syllabus'] = syllabus
-        state['current_lesson'] = 0
-        # render syllabus summary + lesson 1
-        syllabus_text = "Syllabus:\n" + "\n".join([f"{i+1}. {s['title']} - {s['summary']}" for i, s in enumerate(syllabus)])
-        lesson_text = render_lesson(state, 0)
-        state['response'] = f"Starting course: {topic}\n\n{syllabus_text}\n\n---\n{lesson_text}\n\nControls: 'next', 'prev', 'repeat', 'goto <n>', 'stop', or ask a concept question."
+        state['response'] = await start_course(state, topic, defer)
         return state
     else:
         # concept -> give focused explanation
-        explanation = generate_concept_explanation(query)
+        explanation = await generate_concept_explanation(query)
         state['mode'] = 'concept'
         state['response'] = explanation
         return state
 
-def classify_query(query: str):
+async def classify_query(query: str):
     try:
         prompt = classify_prompt.format(query=query)
         # res = model.invoke(prompt)
-        res = gemini_invoke_simple(prompt)
+        res = await gemini_generate(prompt)
         # parsed = safe_json_parse(res.content)
         parsed = safe_json_parse(res)
         if parsed and 'type' in parsed:
@@ -485,11 +557,11 @@ def classify_query(query: str):
     else:
         return {'type': 'concept', 'topic': query, 'reason': 'heuristic fallback'}
     
-def generate_syllabus(topic: str):
+async def generate_syllabus(topic: str):
     try:
         prompt = syllabus_prompt.format(topic=topic)
         # res = model.invoke(prompt)
-        res = gemini_invoke_simple(prompt)
+        res = await gemini_generate(prompt)
         # parsed = safe_json_parse(res.content)
         parsed = safe_json_parse(res)
         if isinstance(parsed, list):
@@ -516,7 +588,7 @@ def generate_syllabus(topic: str):
         Return one lesson title per line, no numbering.
         '''
         # res = model.invoke(fallback_prompt)
-        res = gemini_invoke_simple(fallback_prompt)
+        res = await gemini_generate(fallback_prompt)
         # lines = [l.strip() for l in res.content.splitlines() if l.strip()]
         lines = [l.strip() for l in res.splitlines() if l.strip()]
         # Remove numbering and clean up titles
@@ -541,39 +613,88 @@ def generate_syllabus(topic: str):
         {'title': f'Mastering {topic}', 'summary': 'Advanced mastery and expert techniques'}
     ]
 
-def generate_lesson_text(topic: str, index: int, title: str):
+def _lesson_prompt_for(topic: str, index: int, title: str) -> str:
+    return lesson_prompt.format(
+        topic=topic,
+        index_plus1=index+1,
+        next_index=index+2,
+        title=title
+    )
+
+def _cache_lesson(key: str, topic: str, index: int, title: str):
+    async def store(text: str):
+        if text and not is_llm_error(text):
+            await lesson_cache.aput(key, text, topic=topic, lesson_index=index, title=title, model=MODEL_NAME)
+    return store
+
+async def generate_lesson_text(topic: str, index: int, title: str):
     try:
-        prompt = lesson_prompt.format(
-            topic=topic,
-            index_plus1=index+1,
-            next_index=index+2,
-            title=title
-        )
-        # res = model.invoke(prompt)
-        res = gemini_invoke_simple(prompt)
-        # return res.content.strip()
-        return res
+        # Same path as streaming, so a lesson already being generated (e.g.
+        # warmed at course start) is joined instead of requested twice
+        stream = await generate_lesson_text_stream(topic, index, title)
+        try:
+            return "".join([chunk async for chunk in stream])
+        finally:
+            stream.cancel()
     except Exception as e:
         return f"Sorry, couldn't generate lesson due to: {e}"
 
-def generate_lesson_text_stream(topic: str, index: int, title: str):
-    """Generate lesson content with streaming - returns list of chunks instead of generator"""
-    try:
-        prompt = lesson_prompt.format(
-            topic=topic,
-            index_plus1=index+1,
-            next_index=index+2,
-            title=title
-        )
-        return gemini_invoke_list(prompt)
-    except Exception as e:
-        return [f"Sorry, couldn't generate lesson due to: {e}"]
+async def generate_lesson_text_stream(topic: str, index: int, title: str):
+    """Generate lesson content with streaming - chunks arrive as Gemini produces them.
+    Cached lessons are replayed through the same stream interface, and concurrent
+    requests for the same lesson attach to one shared upstream stream."""
+    prompt = _lesson_prompt_for(topic, index, title)
+    key = prompt_cache_key(prompt, MODEL_NAME)
+    cached = await lesson_cache.aget(key)
+    if cached is not None:
+        return CachedStream(cached)
+    return inflight_streams.subscribe(
+        key, lambda: GeminiStream(prompt, on_complete=_cache_lesson(key, topic, index, title))
+    )
     
-def generate_concept_explanation(concept: str):
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
+
+async def _warm_lesson(topic: str, index: int, title: str):
+    stream = await generate_lesson_text_stream(topic, index, title)
+    try:
+        async for _ in stream:
+            pass
+    finally:
+        stream.cancel()
+
+# Speculative "next lesson" generation; the worker count is the global cap on
+# concurrent speculative generations
+prefetcher = PrefetchScheduler(
+    _warm_lesson,
+    workers=int(os.getenv("PREFETCH_WORKERS", 4)),
+    max_pending=int(os.getenv("PREFETCH_MAX_PENDING", 200))
+)
+
+def schedule_prefetch(thread_id: str, values: dict, served_index: int):
+    """After lesson `served_index` is served, generate the next one into the cache.
+    Leaving the course (pause, concept mode) cancels the thread's prefetches."""
+    if values.get('mode') != 'course':
+        prefetcher.cancel_thread(thread_id)
+        return
+    syllabus = values.get('syllabus') or []
+    next_index = served_index + 1
+    if 0 <= next_index < len(syllabus):
+        prefetcher.schedule(thread_id, values.get('topic'), next_index, syllabus[next_index]['title'])
+
+def warm_lesson(topic: str, index: int, title: str):
+    """Start generating a lesson in the background; later readers attach to the
+    in-flight stream and the result lands in the lesson cache"""
+    task = asyncio.ensure_future(_warm_lesson(topic, index, title))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def generate_concept_explanation(concept: str):
     try:
         prompt = concept_prompt.format(concept=concept)
         # res = model.invoke(prompt)
-        res = gemini_invoke_simple(prompt)
+        res = await gemini_generate(prompt)
         # return res.content.strip()
         return res
     except Exception as e:
@@ -581,54 +702,10 @@ def generate_concept_explanation(concept: str):
         return f"Sorry, couldn't generate explanation due to: {e}"
 
 def get_user_performance(user_id: str, topic: str = None) -> dict:
-    """Get user's performance data from MongoDB"""
+    """Get user's performance data from the incrementally maintained user_stats"""
     try:
-        from pymongo import MongoClient
-        import os
-        from dotenv import load_dotenv
-        
-        load_dotenv()
-        client = MongoClient(os.getenv("MONGO_CLIENT"))
-        db = client["learning_platform"]
-        
-        # Get quiz attempts
-        filter_query = {"user_id": user_id}
-        if topic:
-            filter_query["topic"] = topic
-            
-        attempts = list(db.quiz_attempts.find(filter_query).sort("submitted_at", -1))
-        
-        if not attempts:
-            return {"average_score": 0, "total_attempts": 0, "weak_areas": [], "strong_areas": []}
-        
-        # Calculate performance metrics
-        scores = [attempt["score"] for attempt in attempts]
-        average_score = sum(scores) / len(scores)
-        
-        # Get topic-wise performance
-        topic_scores = {}
-        for attempt in attempts:
-            topic_name = attempt["topic"]
-            if topic_name not in topic_scores:
-                topic_scores[topic_name] = []
-            topic_scores[topic_name].append(attempt["score"])
-        
-        # Calculate average scores per topic
-        for topic_name in topic_scores:
-            topic_scores[topic_name] = sum(topic_scores[topic_name]) / len(topic_scores[topic_name])
-        
-        # Identify weak and strong areas
-        weak_areas = [topic for topic, score in topic_scores.items() if score < 60]
-        strong_areas = [topic for topic, score in topic_scores.items() if score >= 80]
-        
-        return {
-            "average_score": average_score,
-            "total_attempts": len(attempts),
-            "weak_areas": weak_areas,
-            "strong_areas": strong_areas,
-            "topic_scores": topic_scores,
-            "recent_scores": scores[:5]  # Last 5 scores
-        }
+        # One indexed lookup per topic, independent of how many attempts exist
+        return db.summarize_user_stats(db.get_user_stats(user_id, topic))
     except Exception as e:
         print(f"Error getting user performance: {e}")
         return {"average_score": 0, "total_attempts": 0, "weak_areas": [], "strong_areas": []}
@@ -728,7 +805,9 @@ def adapt_syllabus_based_on_performance(syllabus: list, performance: dict, curre
         print(f"Error adapting syllabus: {e}")
         return syllabus
 
-def render_lesson(state: Agentstate, lesson_idx: int) -> str:
+async def render_lesson(state: Agentstate, lesson_idx: int, defer: bool = False) -> str:
+    """Render lesson header + body. With `defer` only the header is returned and
+    the index is left in state['pending_lesson'] for the caller to stream."""
     syllabus = state.get('syllabus', [])
     if not syllabus or lesson_idx < 0 or lesson_idx >= len(syllabus):
         return "Lesson not found."
@@ -738,18 +817,21 @@ def render_lesson(state: Agentstate, lesson_idx: int) -> str:
     
     try:
         # Get user performance for adaptive learning
-        user_performance = get_user_performance("default_user", topic)
-        state['user_performance'] = user_performance
+        # Blocking MongoDB read - keep it off the event loop
+        user_performance = await asyncio.to_thread(get_user_performance, "default_user", topic)
         
         # Generate adaptive recommendations
         recommendations = generate_adaptive_recommendations(user_performance, topic)
         state['adaptive_recommendations'] = recommendations
         
-        # Adapt syllabus if needed
-        adapted_syllabus = adapt_syllabus_based_on_performance(syllabus, user_performance, topic)
-        if adapted_syllabus != syllabus:
-            state['syllabus'] = adapted_syllabus
-            syllabus = adapted_syllabus
+        # Adapt syllabus if needed - once per course, since the session now
+        # persists and re-adapting would keep inserting practice lessons
+        if not state.get('syllabus_adapted'):
+            adapted_syllabus = adapt_syllabus_based_on_performance(syllabus, user_performance, topic)
+            if adapted_syllabus != syllabus:
+                state['syllabus'] = adapted_syllabus
+                syllabus = adapted_syllabus
+            state['syllabus_adapted'] = True
         
     except Exception as e:
         print(f"Error in adaptive learning: {e}")
@@ -757,10 +839,6 @@ def render_lesson(state: Agentstate, lesson_idx: int) -> str:
         user_performance = {"average_score": 0, "total_attempts": 0, "weak_areas": [], "strong_areas": []}
         recommendations = []
     
-    # try to reuse cached lesson content if you stored one (optional)
-    # For simplicity we generate fresh content each time (you can cache into state if desired)
-    lesson_text = generate_lesson_text(topic, lesson_idx, title)
-    
     # Add adaptive recommendations to lesson header
     header = f"Lesson {lesson_idx+1}: {title}\n(Topic: {topic})\n\n"
     
@@ -770,15 +848,38 @@ def render_lesson(state: Agentstate, lesson_idx: int) -> str:
         for rec in recommendations:
             header += f"• {rec['message']}\n"
         header += "\n"
+
+    if defer:
+        state['pending_lesson'] = lesson_idx
+        return header
     
+    # Served from the shared lesson cache when any student already generated it
+    lesson_text = await generate_lesson_text(topic, lesson_idx, title)
     return header + lesson_text
 
+async def tutor_turn(state: Agentstate, config: RunnableConfig) -> Agentstate:
+    state = await handle_query(state, config)
+    thread_id = config.get('configurable', {}).get('thread_id')
+    schedule_prefetch(thread_id, state, state.get('current_lesson', 0))
+    return state
+
 graph = StateGraph(Agentstate)
-graph.add_node("handle_query", handle_query)
+graph.add_node("handle_query", tutor_turn)
 graph.add_edge(START, "handle_query")
 graph.add_edge("handle_query", END)
 
-workflow = graph.compile()
+workflow = graph.compile(checkpointer=saver)
+
+async def prefetch_after_lesson(thread_id: str, topic: str, lesson_index: int):
+    """Prefetch for lessons served outside the graph (/lesson-stream)"""
+    try:
+        snapshot = await workflow.aget_state({"configurable": {"thread_id": thread_id}})
+        values = snapshot.values or {}
+        # Only trust the session if it is the course this lesson belongs to
+        if values.get('topic') == topic:
+            schedule_prefetch(thread_id, values, lesson_index)
+    except Exception as e:
+        print(f"Error scheduling prefetch: {e}")
 
 # thread_id = '1'
 # print("chat started. Type 'exit' to stop.\nCommands while in a course: next, prev, repeat, goto <n>, stop\n")
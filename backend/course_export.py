@@ -0,0 +1,195 @@
+import asyncio
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.notes_pdf import course_pdf, lesson_section_pdf, pdf_cache, pdf_cache_key
+
+FINISHED = ("done", "failed")
+
+
+class CourseExportJobs:
+    """Whole-course notes PDFs, built in the background.
+
+    Lesson text comes from `load_lesson(topic, index, title)` (the lesson cache,
+    generating on a miss), at most `lesson_concurrency` lessons at a time per
+    job. Layout is CPU-bound ReportLab work, so each lesson is laid out as its
+    own PDF in a process pool of `workers` processes. The sections are then
+    merged behind a table of contents. Laid-out sections are kept in the notes
+    PDF cache, so exporting the same course again only merges.
+
+    Jobs live in memory: clients poll `snapshot` or follow `events`, then fetch
+    the finished PDF. Finished jobs are dropped after `ttl_seconds`, or sooner
+    once more than `max_jobs` are kept.
+    """
+
+    def __init__(self, load_lesson, workers: int = 2, lesson_concurrency: int = 4,
+                 max_jobs: int = 50, max_running: int = 4, ttl_seconds: int = 3600):
+        self._load_lesson = load_lesson
+        self._workers = workers
+        self._lesson_concurrency = lesson_concurrency
+        self._max_jobs = max_jobs
+        self._max_running = max_running
+        self._ttl = ttl_seconds
+        self._pool = None
+        self._jobs = {}  # job_id -> job, oldest first
+        self._tasks = set()
+        self.started = 0
+        self.reused = 0
+        self.failed = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a server with live threads and sockets is not safe
+            self._pool = ProcessPoolExecutor(max_workers=self._workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _prune(self):
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job["status"] in FINISHED]
+        for job in finished:
+            if now - job["finished_at"] > self._ttl:
+                del self._jobs[job["job_id"]]
+        finished = [job for job in self._jobs.values() if job["status"] in FINISHED]
+        for job in finished[:max(0, len(self._jobs) - self._max_jobs)]:
+            del self._jobs[job["job_id"]]
+
+    def start(self, topic: str, lessons: list):
+        """Job for exporting [(index, title), ...] of `topic`; None if too many are running"""
+        self._prune()
+        # The same export already running or recently finished is shared
+        for job in self._jobs.values():
+            if job["topic"] == topic and job["lessons"] == lessons and job["status"] != "failed":
+                self.reused += 1
+                return job
+        if sum(job["status"] not in FINISHED for job in self._jobs.values()) >= self._max_running:
+            return None
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "topic": topic,
+            "lessons": lessons,
+            "status": "queued",
+            "completed": 0,
+            "errors": [],
+            "error": None,
+            "pdf": None,
+            "created_at": time.time(),
+            "finished_at": None,
+            "changed": asyncio.Event(),
+        }
+        self._jobs[job["job_id"]] = job
+        self.started += 1
+        task = asyncio.ensure_future(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    @staticmethod
+    def snapshot(job: dict) -> dict:
+        return {
+            "job_id": job["job_id"],
+            "topic": job["topic"],
+            "status": job["status"],
+            "total": len(job["lessons"]),
+            "completed": job["completed"],
+            "errors": job["errors"],
+            "error": job["error"],
+            "size": len(job["pdf"]) if job["pdf"] else None,
+        }
+
+    def _notify(self, job: dict):
+        # Wake every follower, then arm a fresh event for the next change
+        job["changed"].set()
+        job["changed"] = asyncio.Event()
+
+    async def events(self, job: dict):
+        """Snapshots of `job`, one per change, ending once it has finished"""
+        while True:
+            changed = job["changed"]
+            yield self.snapshot(job)
+            if job["status"] in FINISHED:
+                return
+            await changed.wait()
+
+    async def _section(self, job: dict, index: int, title: str, limit: asyncio.Semaphore) -> bytes:
+        topic = job["topic"]
+        async with limit:
+            # Raises if the lesson cannot be produced
+            lesson_text = await self._load_lesson(topic, index, title)
+        key = "section:" + pdf_cache_key(lesson_text, topic, title)
+        section = pdf_cache.get(key)
+        if section is None:
+            section = await self._in_pool(lesson_section_pdf, lesson_text, topic, title)
+            pdf_cache.put(key, section)
+        return section
+
+    async def _run(self, job: dict):
+        job["status"] = "running"
+        self._notify(job)
+        limit = asyncio.Semaphore(self._lesson_concurrency)
+        try:
+            tasks = [
+                asyncio.ensure_future(self._section(job, index, title, limit))
+                for index, title in job["lessons"]
+            ]
+            for (index, title), task in zip(job["lessons"], tasks):
+                task.add_done_callback(lambda done, index=index, title=title: self._lesson_done(job, index, title, done))
+            await asyncio.wait(tasks)
+
+            titles, sections = [], []
+            for (_, title), task in zip(job["lessons"], tasks):
+                if task.exception() is None:
+                    titles.append(title)
+                    sections.append(task.result())
+            if not sections:
+                raise RuntimeError("No lesson could be exported")
+
+            job["pdf"] = await self._in_pool(course_pdf, job["topic"], titles, sections)
+            job["status"] = "done"
+        except Exception as e:
+            print(f"Course export error for {job['topic']}: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+            self.failed += 1
+        finally:
+            job["finished_at"] = time.time()
+            self._notify(job)
+
+    async def _in_pool(self, fn, *args):
+        pool = self._executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # A crashed worker poisons the whole pool: reap its processes and
+            # start a new one next time (unless another failure already did)
+            pool.shutdown(wait=False, cancel_futures=True)
+            if self._pool is pool:
+                self._pool = None
+            raise
+
+    def _lesson_done(self, job: dict, index: int, title: str, task: asyncio.Task):
+        job["completed"] += 1
+        if not task.cancelled() and task.exception() is not None:
+            job["errors"].append({"lesson_index": index, "lesson_title": title, "error": str(task.exception())})
+        self._notify(job)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        statuses = [job["status"] for job in self._jobs.values()]
+        return {
+            "jobs": len(statuses),
+            "running": sum(status not in FINISHED for status in statuses),
+            "started": self.started,
+            "reused": self.reused,
+            "failed": self.failed,
+        }
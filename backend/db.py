@@ -0,0 +1,333 @@
+import base64
+import os
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient
+from pymongo.errors import DuplicateKeyError
+
+from backend.session_store import build_session_saver
+
+load_dotenv()
+
+# Shared MongoDB access: one pooled client per process. Every module goes
+# through the helpers below instead of building its own MongoClient, so
+# requests reuse warm connections instead of paying TCP/TLS handshakes and
+# server discovery. Pool size, timeouts and read preference come from the env.
+
+
+def _client_options() -> dict:
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 5)),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 5 * 60 * 1000)),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 20000)),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primaryPreferred"),
+        "retryWrites": True,
+        "appname": "gyaansetu-backend",
+    }
+
+
+# MongoClient is thread-safe and connects lazily, so importing this module is cheap
+client = MongoClient(os.getenv("MONGO_CLIENT"), **_client_options())
+
+learning_db = client["learning_platform"]
+SESSION_DB_NAME = "chatbot_langgraph"
+
+quizzes = learning_db["quizzes"]
+quiz_attempts = learning_db["quiz_attempts"]
+user_stats = learning_db["user_stats"]
+lesson_cache = learning_db["lesson_cache"]
+question_bank = learning_db["question_bank"]
+migrations = learning_db["migrations"]
+roadmap_cache = learning_db["roadmap_cache"]
+
+RECENT_SCORES_KEPT = 5
+WEAK_AREA_BELOW = 60
+STRONG_AREA_FROM = 80
+USER_STATS_BACKFILL = "user_stats_backfill"
+
+# Only what the readers render; attempts also carry large answers/detailed_results arrays
+QUIZ_GRADING_FIELDS = {"_id": 0, "questions": 1}
+ATTEMPT_SUMMARY_FIELDS = {
+    "topic": 1, "lesson_index": 1, "score": 1, "correct_answers": 1,
+    "total_questions": 1, "time_spent": 1, "submitted_at": 1,
+}
+# Newest first; _id makes the order total so keyset pagination never skips or repeats
+ATTEMPT_ORDER = [("submitted_at", DESCENDING), ("_id", DESCENDING)]
+MAX_HISTORY_PAGE = 100
+
+
+# ---------- indexes ----------
+# Declared here and created idempotently at startup: create_indexes is a no-op
+# for indexes that already exist with the same spec.
+
+INDEXES = [
+    (quizzes, [
+        IndexModel([("quiz_id", ASCENDING)], unique=True, name="quiz_id_unique"),
+    ]),
+    (quiz_attempts, [
+        # _id breaks submitted_at ties so history pages are served straight off the index
+        IndexModel(
+            [("user_id", ASCENDING), ("topic", ASCENDING), ("submitted_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_topic_submitted_at_id",
+        ),
+        # Cross-topic dashboard: newest attempts for a user regardless of topic
+        IndexModel(
+            [("user_id", ASCENDING), ("submitted_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_submitted_at_id",
+        ),
+    ]),
+    (user_stats, [
+        IndexModel([("user_id", ASCENDING), ("topic", ASCENDING)], unique=True, name="user_topic_unique"),
+    ]),
+    (roadmap_cache, [
+        # MongoDB deletes each cached roadmap once its expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ]),
+]
+
+
+def ensure_indexes():
+    for collection, models in INDEXES:
+        try:
+            collection.create_indexes(models)
+        except Exception as e:
+            print(f"Error creating indexes on {collection.name}: {e}")
+
+
+def _plan_stages(plan: dict) -> list:
+    """Flatten a winning plan into (stage, index name) pairs, leaf-most last"""
+    stages = []
+    while plan:
+        stages.append((plan.get("stage"), plan.get("indexName")))
+        # Classic plans nest under inputStage; SBE plans wrap them in queryPlan
+        plan = plan.get("queryPlan") or plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return stages
+
+
+def explain_hot_queries():
+    """Print the winning plan of every hot read path so collection scans show up at startup"""
+    probes = {
+        "quizzes by quiz_id": quizzes.find({"quiz_id": "explain-probe"}, QUIZ_GRADING_FIELDS).limit(1),
+        "recent attempts (user, topic)": quiz_attempts.find(
+            {"user_id": "explain-probe", "topic": "explain-probe"}, ATTEMPT_SUMMARY_FIELDS
+        ).sort(ATTEMPT_ORDER).limit(RECENT_SCORES_KEPT),
+        "recent attempts (user)": quiz_attempts.find(
+            {"user_id": "explain-probe"}, ATTEMPT_SUMMARY_FIELDS
+        ).sort(ATTEMPT_ORDER).limit(RECENT_SCORES_KEPT),
+        "user_stats (user, topic)": user_stats.find({"user_id": "explain-probe", "topic": "explain-probe"}),
+    }
+    for name, cursor in probes.items():
+        try:
+            stages = _plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+        except Exception as e:
+            print(f"Query plan [{name}]: explain failed: {e}")
+            continue
+        plan = " <- ".join(f"{stage}({index})" if index else stage for stage, index in stages)
+        warning = "  WARNING: collection scan" if any(stage == "COLLSCAN" for stage, _ in stages) else ""
+        print(f"Query plan [{name}]: {plan}{warning}")
+
+
+# ---------- quizzes ----------
+
+def get_quiz(quiz_id: str) -> Optional[dict]:
+    return quizzes.find_one({"quiz_id": quiz_id}, QUIZ_GRADING_FIELDS)
+
+
+def save_quiz(quiz_doc: dict):
+    quizzes.insert_one(quiz_doc)
+
+
+def save_quizzes(quiz_docs: list):
+    # Unordered: one bad document does not stop the rest of the batch
+    quizzes.insert_many(quiz_docs, ordered=False)
+
+
+# ---------- question bank ----------
+# Generated question sets shared by every learner of the same lesson content
+
+def get_bank_questions(key: str) -> Optional[list]:
+    doc = question_bank.find_one({"_id": key}, {"questions": 1})
+    return doc["questions"] if doc else None
+
+
+def save_bank_questions(key: str, topic: str, lesson_title: str, content_hash: str, questions: list):
+    question_bank.update_one(
+        {"_id": key},
+        {
+            "$set": {
+                "topic": topic,
+                "lesson_title": lesson_title,
+                "content_hash": content_hash,
+                "questions": questions,
+            },
+            "$setOnInsert": {"created_at": datetime.now()},
+        },
+        upsert=True,
+    )
+
+
+# ---------- quiz attempts ----------
+
+def save_quiz_attempt(attempt_doc: dict):
+    quiz_attempts.insert_one(attempt_doc)
+
+
+def _attempts_filter(user_id: str, topic: Optional[str]) -> dict:
+    filter_query = {"user_id": user_id}
+    if topic:
+        filter_query["topic"] = topic
+    return filter_query
+
+
+def recent_quiz_attempts(user_id: str, topic: Optional[str] = None, limit: int = 5) -> list:
+    cursor = quiz_attempts.find(_attempts_filter(user_id, topic), ATTEMPT_SUMMARY_FIELDS)
+    return list(cursor.sort(ATTEMPT_ORDER).limit(limit))
+
+
+def encode_history_cursor(attempt: dict) -> str:
+    """Opaque cursor pointing just past `attempt` in ATTEMPT_ORDER"""
+    raw = f"{attempt['submitted_at'].isoformat()}|{attempt['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_history_cursor(cursor: str):
+    submitted_at, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(submitted_at), ObjectId(oid)
+
+
+def quiz_attempt_page(user_id: str, topic: Optional[str] = None, cursor: Optional[str] = None,
+                      limit: int = 20) -> tuple:
+    """One page of attempt history as (attempts, next_cursor); next_cursor is None on the last page"""
+    limit = max(1, min(limit, MAX_HISTORY_PAGE))
+    filter_query = _attempts_filter(user_id, topic)
+    if cursor:
+        # Keyset pagination: seek past the last row instead of skipping N rows
+        submitted_at, oid = _decode_history_cursor(cursor)
+        filter_query["$or"] = [
+            {"submitted_at": {"$lt": submitted_at}},
+            {"submitted_at": submitted_at, "_id": {"$lt": oid}},
+        ]
+    # One extra row tells us whether another page exists
+    rows = list(
+        quiz_attempts.find(filter_query, ATTEMPT_SUMMARY_FIELDS, batch_size=limit + 1)
+        .sort(ATTEMPT_ORDER)
+        .limit(limit + 1)
+    )
+    page = rows[:limit]
+    next_cursor = encode_history_cursor(page[-1]) if len(rows) > limit else None
+    return page, next_cursor
+
+
+# ---------- per-user performance aggregates ----------
+# One user_stats document per (user_id, topic), maintained on every quiz
+# submission so readers never rescan the attempt history.
+
+def _stats_update(score: float, at) -> list:
+    # Update pipeline: the counters, the last-N ring and the derived flags are
+    # all computed server-side in a single atomic write. user_id and topic are
+    # not set here: the upsert seeds them from the filter, and request strings
+    # inside a pipeline would be evaluated ("$name" reads as a field path).
+    return [
+        {"$set": {
+            "count": {"$add": [{"$ifNull": ["$count", 0]}, 1]},
+            "score_sum": {"$add": [{"$ifNull": ["$score_sum", 0]}, score]},
+            "recent": {"$slice": [
+                {"$concatArrays": [[{"score": score, "at": at}], {"$ifNull": ["$recent", []]}]},
+                RECENT_SCORES_KEPT,
+            ]},
+            "last_attempt_at": at,
+        }},
+        {"$set": {"average_score": {"$divide": ["$score_sum", "$count"]}}},
+        {"$set": {
+            "is_weak": {"$lt": ["$average_score", WEAK_AREA_BELOW]},
+            "is_strong": {"$gte": ["$average_score", STRONG_AREA_FROM]},
+        }},
+    ]
+
+
+def record_attempt_stats(user_id: str, topic: str, score: float, at):
+    user_stats.update_one(
+        {"user_id": user_id, "topic": topic},
+        _stats_update(score, at),
+        upsert=True,
+    )
+
+
+def backfill_user_stats():
+    """Build user_stats from the attempt history once, for attempts made before it existed.
+
+    A marker in `migrations` records that the backfill ran, so it happens on
+    the first startup only and the read path never rescans attempts.
+    """
+    try:
+        migrations.insert_one({"_id": USER_STATS_BACKFILL, "started_at": datetime.now()})
+    except DuplicateKeyError:
+        return
+    try:
+        quiz_attempts.aggregate([
+            {"$sort": {"user_id": 1, "topic": 1, "submitted_at": -1}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "topic": "$topic"},
+                "count": {"$sum": 1},
+                "score_sum": {"$sum": "$score"},
+                "recent": {"$push": {"score": "$score", "at": "$submitted_at"}},
+                "last_attempt_at": {"$first": "$submitted_at"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "user_id": "$_id.user_id",
+                "topic": "$_id.topic",
+                "count": 1,
+                "score_sum": 1,
+                "recent": {"$slice": ["$recent", RECENT_SCORES_KEPT]},
+                "last_attempt_at": 1,
+                "average_score": {"$divide": ["$score_sum", "$count"]},
+            }},
+            {"$set": {
+                "is_weak": {"$lt": ["$average_score", WEAK_AREA_BELOW]},
+                "is_strong": {"$gte": ["$average_score", STRONG_AREA_FROM]},
+            }},
+            # Matches on the user_topic_unique index
+            {"$merge": {"into": user_stats.name, "on": ["user_id", "topic"],
+                        "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True)
+        migrations.update_one({"_id": USER_STATS_BACKFILL}, {"$set": {"finished_at": datetime.now()}})
+    except Exception as e:
+        print(f"Error backfilling user_stats: {e}")
+        # Let the next startup try again
+        migrations.delete_one({"_id": USER_STATS_BACKFILL})
+
+
+def get_user_stats(user_id: str, topic: Optional[str] = None) -> list:
+    return list(user_stats.find(_attempts_filter(user_id, topic), {"_id": 0}))
+
+
+def summarize_user_stats(docs: list) -> dict:
+    """Fold per-topic stats into the performance shape used by the tutor and dashboard"""
+    total_attempts = sum(d["count"] for d in docs)
+    if not total_attempts:
+        return {"average_score": 0, "total_attempts": 0, "weak_areas": [], "strong_areas": [],
+                "topic_scores": {}, "recent_scores": []}
+    recent = sorted((r for d in docs for r in d.get("recent", [])), key=lambda r: r["at"], reverse=True)
+    return {
+        "average_score": sum(d["score_sum"] for d in docs) / total_attempts,
+        "total_attempts": total_attempts,
+        "weak_areas": [d["topic"] for d in docs if d.get("is_weak")],
+        "strong_areas": [d["topic"] for d in docs if d.get("is_strong")],
+        "topic_scores": {d["topic"]: d["average_score"] for d in docs},
+        "recent_scores": [r["score"] for r in recent[:RECENT_SCORES_KEPT]],
+    }
+
+
+# ---------- sessions ----------
+
+def session_saver(collection_name: str, ttl_seconds: Optional[int] = None):
+    """LangGraph checkpointer on the pooled client, one collection per graph"""
+    return build_session_saver(client, SESSION_DB_NAME, collection_name, ttl_seconds)
@@ -0,0 +1,156 @@
+import re
+import threading
+from collections import Counter
+from typing import Optional
+
+# Leading phrases -> intent. Matched on whole tokens through a small trie so a
+# query is scanned once, however many phrases we add.
+_PREFIX_INTENTS = {
+    "course": [
+        "teach me", "teach me about", "i want to learn", "i want to study", "i wanna learn",
+        "i would like to learn", "help me learn", "learn", "start a course on", "start course on",
+        "course on", "full course on", "complete course on", "syllabus for", "make a course on",
+        "create a course on",
+    ],
+    "concept": [
+        "what is", "what are", "what's", "whats", "what is a", "what is an", "what is the",
+        "explain", "explain me", "explain to me", "define", "definition of", "describe",
+        "how does", "how do", "how to", "difference between", "tell me about",
+    ],
+    "doubt": [
+        "i don't understand", "i dont understand", "i do not understand", "i am confused about",
+        "i'm confused about", "im confused about", "confused about", "why does", "why is",
+        "why do", "doubt", "my doubt is", "i have a doubt about", "i have a doubt in",
+    ],
+    "quiz": [
+        "quiz me on", "quiz me about", "quiz me", "test me on", "test me about",
+        "give me a quiz on", "practice questions on", "practice questions for",
+    ],
+}
+
+# Markers that make a course request unambiguous anywhere in the query
+_COURSE_MARKERS = re.compile(
+    r"\b(full course|complete course|whole course|entire course|from scratch|from basics|"
+    r"from the basics|syllabus|step by step|roadmap|zero to hero|beginner to advanced)\b",
+    re.IGNORECASE,
+)
+_TOKEN = re.compile(r"[a-z0-9+#']+")
+
+_NAVIGATION = [
+    (re.compile(r"^(?:next|n|continue|resume|go on|proceed)(?: (?:lesson|chapter|one|please))*$"), "next"),
+    (re.compile(r"^(?:prev|previous|back|go back)(?: (?:lesson|chapter|one|please))*$"), "prev"),
+    (re.compile(r"^(?:repeat|again|repeat (?:this|the) lesson|one more time)(?: please)?$"), "repeat"),
+    (re.compile(r"^(?:stop|end|quit|exit|pause)(?: (?:the )?(?:course|lesson))?$"), "stop"),
+    (re.compile(r"^(?:goto|go to|jump to|open|skip to|lesson)(?: lesson)? (\d+)$"), "goto"),
+]
+
+# Longer than this and a leading phrase is no longer a reliable signal
+_MAX_TOPIC_WORDS = 8
+
+
+def _build_trie(phrases: dict) -> dict:
+    root = {}
+    for intent, items in phrases.items():
+        for phrase in items:
+            node = root
+            for token in _TOKEN.findall(phrase):
+                node = node.setdefault(token, {})
+            node["$"] = intent
+    return root
+
+
+_TRIE = _build_trie(_PREFIX_INTENTS)
+
+
+def _longest_prefix(tokens: list):
+    """Return (intent, number of tokens consumed) for the longest known leading phrase"""
+    node = _TRIE
+    best = (None, 0)
+    for i, token in enumerate(tokens):
+        node = node.get(token)
+        if node is None:
+            break
+        if "$" in node:
+            best = (node["$"], i + 1)
+    return best
+
+
+class IntentRouter:
+    """Local, LLM-free intent router for tutor queries.
+
+    `route()` returns a classification dict in the same shape as
+    `classify_query` (plus 'intent'), or None when the query is ambiguous and
+    should go to the LLM classifier. Hit/miss counters back `stats()`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fallbacks = 0
+        self.by_intent = Counter()
+
+    def route(self, query: str) -> Optional[dict]:
+        result = self._classify(query)
+        with self._lock:
+            if result is None:
+                self.fallbacks += 1
+            else:
+                self.routed += 1
+                self.by_intent[result["intent"]] += 1
+        return result
+
+    def _classify(self, query: str) -> Optional[dict]:
+        original = " ".join(query.split()).rstrip("?.!")
+        q = original.lower()
+        if not q:
+            return None
+
+        for pattern, command in _NAVIGATION:
+            m = pattern.match(q)
+            if m:
+                if command == "goto":
+                    command = f"goto {m.group(1)}"
+                return {"type": "navigation", "intent": "navigation", "command": command,
+                        "topic": "", "reason": "router: navigation command"}
+
+        matches = list(_TOKEN.finditer(q))
+        tokens = [m.group(0) for m in matches]
+        intent, consumed = _longest_prefix(tokens)
+        if intent is None:
+            return None
+
+        # "teach me what is X" is a concept question wearing a course prefix
+        if intent == "course":
+            inner, inner_consumed = _longest_prefix(tokens[consumed:])
+            if inner in ("concept", "doubt"):
+                intent = inner
+                consumed += inner_consumed
+        elif _COURSE_MARKERS.search(q):
+            # "explain DSA from scratch" - conflicting signals, let the LLM decide
+            return None
+
+        if consumed >= len(tokens) or len(tokens) - consumed > _MAX_TOPIC_WORDS:
+            return None
+        # Keep the user's own spelling of the topic ("Node.js", "C++")
+        source = original if len(original) == len(q) else q
+        topic = source[matches[consumed].start():]
+        topic = _COURSE_MARKERS.sub("", topic).strip(" ,:-")
+        if not topic:
+            return None
+
+        # The tutor graph knows courses and concept explanations; doubts and
+        # quiz requests are answered with a focused explanation (which ends in
+        # practice exercises).
+        graph_type = "course" if intent == "course" else "concept"
+        return {"type": graph_type, "intent": intent, "topic": topic,
+                "reason": f"router: {intent} phrasing"}
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.routed + self.fallbacks
+            return {
+                "routed": self.routed,
+                "llm_fallbacks": self.fallbacks,
+                "hit_rate": round(self.routed / total, 4) if total else 0.0,
+                "by_intent": dict(self.by_intent),
+            }
@@ -0,0 +1,482 @@
+import base64
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from backend.limited_process import MAX_OUTPUT_BYTES, limited_command, sandbox_popen_args
+from backend.native_runner import BinaryCache
+from backend.warm_pool import WarmInterpreterPool, WorkerFailure, failed_runs
+
+SANDBOX_CACHE_DIR = os.getenv("SANDBOX_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gyaansetu-sandbox"))
+JAVA_CACHE_DIR = os.path.join(SANDBOX_CACHE_DIR, "java")
+JAVA_CLASS_CACHE_DIR = os.path.join(JAVA_CACHE_DIR, "classes")
+JAVA_HEAP_MB = int(os.getenv("SANDBOX_JAVA_HEAP_MB", 256))
+JAVA_COMPILE_TIMEOUT = int(os.getenv("SANDBOX_JAVA_COMPILE_TIMEOUT", 20))
+
+_PUBLIC_CLASS = re.compile(r"\bpublic\s+(?:final\s+|abstract\s+)*class\s+([A-Za-z_$][\w$]*)")
+
+# Long-lived JVM that compiles with the in-process javac API and runs each
+# test input in its own classloader and thread group, under a watchdog.
+#   COMPILE <b64 out dir> <class> <b64 source>       -> OK | ERR <b64 diagnostics>
+#   RUN <b64 class dir> <class> <timeout ms> <b64 stdin>,...
+#                                                    -> DONE|EXIT|TIMEOUT <records>
+# A record is b64(stdout) TAB b64(stderr) TAB exit code TAB millis TAB cpu
+# millis (-1 if unknown) TAB 1 if output was truncated, else 0. EXIT (user
+# code called System.exit, or left daemon threads running) and TIMEOUT (a
+# thread that cannot be stopped) mean the JVM is going away; their reply may
+# cover fewer inputs than were sent.
+# The JVM's own exit status is the System.exit status (124 after TIMEOUT), so
+# the last record's exit code is taken from it.
+JAVA_HOST_SOURCE = r"""
+import java.io.*;
+import java.lang.management.ManagementFactory;
+import java.lang.management.ThreadMXBean;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URI;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.util.*;
+import java.util.concurrent.atomic.AtomicLong;
+import java.util.concurrent.atomic.AtomicReference;
+import javax.tools.*;
+
+public class JavaHost {
+    static final Base64.Encoder ENC = Base64.getEncoder();
+    static final Base64.Decoder DEC = Base64.getDecoder();
+    static final PrintStream REPLIES = new PrintStream(new FileOutputStream(FileDescriptor.out), true);
+    static final InputStream STDIN = System.in;
+    static final PrintStream STDOUT = System.out;
+    static final PrintStream STDERR = System.err;
+    static final JavaCompiler COMPILER = ToolProvider.getSystemJavaCompiler();
+    static final StandardJavaFileManager FILES =
+        COMPILER == null ? null : COMPILER.getStandardFileManager(null, null, StandardCharsets.UTF_8);
+    static final ThreadMXBean THREADS = ManagementFactory.getThreadMXBean();
+    static final int MAX_OUTPUT = Integer.getInteger("sandbox.maxOutput", 1024 * 1024);
+
+    // Thrown into the submission when it writes past MAX_OUTPUT; an Error, so catch (Exception) keeps it going
+    static class OutputLimit extends Error {
+        OutputLimit() {
+            super("Output limit exceeded; output truncated", null, false, false);
+        }
+    }
+
+    static class CappedOutput extends ByteArrayOutputStream {
+        volatile boolean truncated;
+
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            int room = MAX_OUTPUT - count;
+            if (len > room) {
+                super.write(b, off, Math.max(room, 0));
+                truncated = true;
+                throw new OutputLimit();
+            }
+            super.write(b, off, len);
+        }
+
+        // Host messages bypass the cap
+        synchronized void note(String text) {
+            byte[] bytes = text.getBytes(StandardCharsets.UTF_8);
+            super.write(bytes, 0, bytes.length);
+        }
+    }
+
+    // The case in flight, so the shutdown hook can report it after System.exit
+    static final List<String> records = new ArrayList<>();
+    static volatile CappedOutput currentOut;
+    static volatile CappedOutput currentErr;
+    static volatile long currentStart;
+
+    public static void main(String[] args) throws IOException {
+        Runtime.getRuntime().addShutdownHook(new Thread(JavaHost::reportExit));
+        BufferedReader requests = new BufferedReader(new InputStreamReader(STDIN, StandardCharsets.UTF_8));
+        String line;
+        while ((line = requests.readLine()) != null) {
+            String[] f = line.split(" ", -1);
+            if (f[0].equals("COMPILE")) {
+                REPLIES.println(compile(Paths.get(text(f[1])), f[2], text(f[3])));
+            } else if (f[0].equals("RUN")) {
+                REPLIES.println("DONE " + run(Paths.get(text(f[1])), f[2], Long.parseLong(f[3]), f[4].split(",", -1)));
+            }
+        }
+    }
+
+    static String text(String encoded) {
+        return new String(DEC.decode(encoded), StandardCharsets.UTF_8);
+    }
+
+    static String b64(String value) {
+        return ENC.encodeToString(value.getBytes(StandardCharsets.UTF_8));
+    }
+
+    static String record(CappedOutput out, CappedOutput err, int exit, long start, long cpuNanos) {
+        return ENC.encodeToString(out.toByteArray()) + "\t" + ENC.encodeToString(err.toByteArray())
+            + "\t" + exit + "\t" + (System.nanoTime() - start) / 1000000
+            + "\t" + (cpuNanos < 0 ? -1 : cpuNanos / 1000000) + "\t" + (out.truncated || err.truncated ? 1 : 0);
+    }
+
+    static String compile(Path outDir, String className, final String source) throws IOException {
+        if (COMPILER == null) {
+            return "ERR " + b64("No Java compiler available in this runtime");
+        }
+        Files.createDirectories(outDir);
+        JavaFileObject file = new SimpleJavaFileObject(
+                URI.create("string:///" + className + ".java"), JavaFileObject.Kind.SOURCE) {
+            @Override
+            public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+                return source;
+            }
+        };
+        StringWriter diagnostics = new StringWriter();
+        Boolean ok = COMPILER.getTask(diagnostics, FILES, null,
+            Arrays.asList("-d", outDir.toString(), "-nowarn"), null, Collections.singletonList(file)).call();
+        return ok ? "OK" : "ERR " + b64(diagnostics.toString());
+    }
+
+    static String run(Path classDir, String mainClass, long timeoutMs, String[] inputs) {
+        records.clear();
+        for (String input : inputs) {
+            CappedOutput out = new CappedOutput();
+            CappedOutput err = new CappedOutput();
+            currentOut = out;
+            currentErr = err;
+            currentStart = System.nanoTime();
+            System.setIn(new ByteArrayInputStream(DEC.decode(input)));
+            System.setOut(new PrintStream(out, true));
+            System.setErr(new PrintStream(err, true));
+            AtomicReference<Throwable> failure = new AtomicReference<>();
+            AtomicLong cpuNanos = new AtomicLong(-1);
+            boolean timedOut = false;
+            boolean leaked = false;
+            // Threads the submission starts join its group, so they can be found after main returns
+            ThreadGroup group = new ThreadGroup("submission");
+            // A fresh loader per case: no static state survives between runs
+            try (URLClassLoader loader = new URLClassLoader(
+                    new URL[] {classDir.toUri().toURL()}, ClassLoader.getPlatformClassLoader())) {
+                Method main = loader.loadClass(mainClass).getMethod("main", String[].class);
+                main.setAccessible(true);  // a package-private "class Main" is fine too
+                Thread runner = new Thread(group, () -> {
+                    try {
+                        main.invoke(null, (Object) new String[0]);
+                    } catch (InvocationTargetException e) {
+                        failure.set(e.getCause());
+                    } catch (Throwable e) {
+                        failure.set(e);
+                    } finally {
+                        cpuNanos.set(THREADS.getCurrentThreadCpuTime());
+                    }
+                }, "submission");
+                // Not a daemon, like a real main thread, so the threads it starts are not daemons either
+                runner.start();
+                // Watchdog: the program ends when its last non-daemon thread does
+                timedOut = !awaitThreads(group, currentStart + timeoutMs * 1000000L);
+                if (runner.isAlive()) {
+                    cpuNanos.set(THREADS.getThreadCpuTime(runner.getId()));
+                }
+                leaked = !timedOut && !liveThreads(group).isEmpty();
+            } catch (Throwable e) {
+                failure.set(e);
+            }
+            try {
+                System.out.flush();
+            } catch (OutputLimit ignored) {
+                // already recorded as truncated
+            }
+            System.setIn(STDIN);
+            if (timedOut || leaked) {
+                // Threads still running must not write into the reply stream before the halt
+                PrintStream discard = new PrintStream(OutputStream.nullOutputStream());
+                System.setOut(discard);
+                System.setErr(discard);
+            } else {
+                System.setOut(STDOUT);
+                System.setErr(STDERR);
+            }
+            currentOut = null;
+            if (timedOut) {
+                err.note("Code execution timed out after " + timeoutMs / 1000 + " seconds");
+                records.add(record(out, err, 124, currentStart, cpuNanos.get()));
+                // The runaway thread cannot be stopped safely; the pool replaces this JVM
+                REPLIES.println("TIMEOUT " + String.join(" ", records));
+                Runtime.getRuntime().halt(124);
+            }
+            int exit = 0;
+            if (failure.get() instanceof OutputLimit) {
+                err.note(failure.get().getMessage());
+                exit = 1;
+            } else if (failure.get() != null) {
+                StringWriter trace = new StringWriter();
+                failure.get().printStackTrace(new PrintWriter(trace));
+                err.note(trace.toString());
+                exit = 1;
+            }
+            if (leaked) {
+                // Daemon threads would die with a real JVM; here they would write into the next case
+                err.note("Background threads were still running when the program ended; they were stopped");
+                records.add(record(out, err, exit, currentStart, cpuNanos.get()));
+                REPLIES.println("EXIT " + String.join(" ", records));
+                Runtime.getRuntime().halt(exit);
+            }
+            records.add(record(out, err, exit, currentStart, cpuNanos.get()));
+        }
+        return String.join(" ", records);
+    }
+
+    static List<Thread> liveThreads(ThreadGroup group) {
+        Thread[] threads = new Thread[group.activeCount() + 16];
+        int n = group.enumerate(threads, true);
+        List<Thread> live = new ArrayList<>();
+        for (int i = 0; i < n; i++) {
+            if (threads[i].isAlive()) {
+                live.add(threads[i]);
+            }
+        }
+        return live;
+    }
+
+    // Waits until no non-daemon thread in the group is running; false if the deadline passes first
+    static boolean awaitThreads(ThreadGroup group, long deadlineNanos) throws InterruptedException {
+        while (true) {
+            Thread waitingFor = null;
+            for (Thread thread : liveThreads(group)) {
+                if (!thread.isDaemon()) {
+                    waitingFor = thread;
+                    break;
+                }
+            }
+            if (waitingFor == null) {
+                return true;
+            }
+            long remainingMs = (deadlineNanos - System.nanoTime()) / 1000000;
+            if (remainingMs <= 0) {
+                return false;
+            }
+            waitingFor.join(remainingMs);
+        }
+    }
+
+    static void reportExit() {
+        CappedOutput out = currentOut;
+        if (out == null) {
+            return;  // normal shutdown, nothing in flight
+        }
+        try {
+            System.out.flush();
+        } catch (OutputLimit ignored) {
+            // already recorded as truncated
+        }
+        // The status passed to System.exit is not visible here; the caller reads it from the process
+        records.add(record(out, currentErr, 0, currentStart, -1));
+        REPLIES.println("EXIT " + String.join(" ", records));
+    }
+}
+"""
+
+
+def _b64(text: str) -> str:
+    return base64.b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def _unb64(data: str) -> str:
+    return base64.b64decode(data).decode("utf-8", errors="replace")
+
+
+def java_class_name(source: str) -> str:
+    """The public class javac expects the file to be named after (Main by convention)"""
+    m = _PUBLIC_CLASS.search(source)
+    return m.group(1) if m else "Main"
+
+
+def _hand_to_host(directory: str, popen_args: dict):
+    """Create `directory` for a host to compile into, owned by the host's user if it has its own"""
+    os.makedirs(directory)
+    if "user" in popen_args:
+        # Others may enter the cache but not list it, so in-flight staging names stay private
+        os.chmod(os.path.dirname(directory), 0o711)
+        os.chown(directory, popen_args["user"], popen_args["group"])
+
+
+def _take_back(directory: str):
+    """Give compiled classes back to the server before publishing them, so code
+    running as the sandbox user cannot rewrite classes other submissions load"""
+    for root, dirs, files in os.walk(directory):
+        for name in dirs + files:
+            os.lchown(os.path.join(root, name), os.geteuid(), os.getegid())
+    os.chown(directory, os.geteuid(), os.getegid())
+
+
+class _JavaHostCodec:
+    @staticmethod
+    def encode(payload: dict) -> str:
+        if payload["op"] == "compile":
+            return f"COMPILE {_b64(payload['dir'])} {payload['class']} {_b64(payload['source'])}"
+        inputs = ",".join(_b64(stdin_text) for stdin_text in payload["inputs"])
+        return f"RUN {_b64(payload['dir'])} {payload['class']} {payload['timeout'] * 1000} {inputs}"
+
+    @staticmethod
+    def decode(line: str, payload: dict):
+        kind, _, body = line.rstrip("\n").partition(" ")
+        if kind == "OK":
+            return {"ok": True}, True
+        if kind == "ERR":
+            return {"ok": False, "error": _unb64(body)}, True
+        results = []
+        for record in body.split(" ") if body else []:
+            out, err, exit_code, millis, cpu_millis, truncated = record.split("\t")
+            results.append({
+                "timed_out": False,
+                "output": _unb64(out),
+                "error": _unb64(err),
+                "exit_code": int(exit_code),
+                "execution_time": int(millis) / 1000,
+                "cpu_time": int(cpu_millis) / 1000 if int(cpu_millis) >= 0 else None,
+                "max_rss": None,  # one JVM heap is shared by every case it runs
+                "output_truncated": truncated == "1",
+            })
+        if kind == "TIMEOUT" and results:
+            results[-1]["timed_out"] = True
+        return results, kind == "DONE"
+
+    @staticmethod
+    def exited(reply, payload: dict, returncode):
+        # After EXIT or TIMEOUT the last record belongs to the case that ended the JVM
+        if reply and returncode is not None:
+            reply[-1]["exit_code"] = returncode
+        return reply
+
+
+class JavaRunner:
+    """Java submissions on warm JVM hosts, with compiled classes cached by source hash.
+
+    Unchanged source is compiled once: later runs go straight to a host that
+    loads the cached classes in a fresh classloader. Compile errors are cached
+    too, so re-running broken code does not recompile it either. Class
+    directories and diagnostics live in a byte-bounded `BinaryCache`.
+    """
+
+    def __init__(self, cache: BinaryCache, size: int = 2, max_runs: int = 200):
+        self.cache = cache
+        self._size = size
+        self._max_runs = max_runs
+        self._pool = None
+        self._popen_args = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        return bool(shutil.which("java") and shutil.which("javac"))
+
+    def _host_pool(self) -> WarmInterpreterPool:
+        with self._lock:
+            if self._pool is None:
+                host_dir = os.path.join(
+                    JAVA_CACHE_DIR, "host", hashlib.sha256(JAVA_HOST_SOURCE.encode()).hexdigest()[:16]
+                )
+                if not os.path.exists(os.path.join(host_dir, "JavaHost.class")):
+                    os.makedirs(host_dir, exist_ok=True)
+                    with open(os.path.join(host_dir, "JavaHost.java"), "w") as f:
+                        f.write(JAVA_HOST_SOURCE)
+                    subprocess.run(["javac", "-d", host_dir, os.path.join(host_dir, "JavaHost.java")],
+                                   check=True, capture_output=True, timeout=60)
+                # The heap is capped with -Xmx: an address-space rlimit breaks JVM startup, and
+                # the host writes compiled classes. Hosts get none of the server's environment
+                # and, where possible, the sandbox user
+                java = os.path.realpath(shutil.which("java"))
+                self._popen_args = sandbox_popen_args(java)
+                argv = limited_command([
+                    java, f"-Xmx{JAVA_HEAP_MB}m", "-Xss8m", "-XX:+UseSerialGC", "-XX:TieredStopAtLevel=1",
+                    "-XX:-UsePerfData", f"-Dsandbox.maxOutput={MAX_OUTPUT_BYTES}", "-cp", host_dir, "JavaHost",
+                ], memory_mb=None, max_processes=None, no_writes=False)
+                self._pool = WarmInterpreterPool(argv, size=self._size, max_runs=self._max_runs,
+                                                 codec=_JavaHostCodec, popen_args=self._popen_args)
+            return self._pool
+
+    def start(self):
+        if not self.available():
+            return
+        try:
+            self._host_pool().start()
+        except Exception as e:
+            print(f"Error starting Java hosts: {e}")
+
+    def compile(self, source: str):
+        """(class dir, main class, None) or (None, None, compiler diagnostics)"""
+        main_class = java_class_name(source)
+        key = hashlib.sha256(f"{main_class}\0{source}".encode("utf-8")).hexdigest()
+        class_dir = self.cache.get(key)
+        if class_dir:
+            return class_dir, main_class, None
+        errors = self.cache.get(f"{key}.err", count=False)
+        if errors:
+            with open(errors, errors="replace") as f:
+                return None, None, f.read()
+
+        # Compile into a private directory, then publish it with an atomic rename
+        pool = self._host_pool()
+        staging = self.cache.staging_path(key)
+        _hand_to_host(staging, self._popen_args)
+        try:
+            reply = pool.request(
+                {"op": "compile", "dir": staging, "class": main_class, "source": source}, JAVA_COMPILE_TIMEOUT
+            )
+        except WorkerFailure:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if not reply["ok"]:
+            shutil.rmtree(staging, ignore_errors=True)
+            error_file = self.cache.staging_path(f"{key}.err")
+            with open(error_file, "w") as f:
+                f.write(reply["error"])
+            self.cache.put(f"{key}.err", error_file)
+            return None, None, reply["error"]
+        _take_back(staging)
+        return self.cache.put(key, staging), main_class, None
+
+    def run(self, source: str, inputs: list, timeout: int = 5) -> list:
+        """[{output, error, exit_code, execution_time}] for each stdin in `inputs`"""
+        try:
+            class_dir, main_class, error = self.compile(source)
+        except WorkerFailure as e:
+            return failed_runs(e, inputs, JAVA_COMPILE_TIMEOUT)
+        except Exception as e:
+            # e.g. the host itself failed to build
+            return failed_runs(WorkerFailure(f"Java sandbox error: {e}"), inputs, timeout)
+        if error is not None:
+            return [{"output": "", "error": f"Compilation error: {error}", "exit_code": 1, "execution_time": 0}
+                    for _ in inputs]
+        results = []
+        # A host that exits mid-request (System.exit, timeout) answers for the
+        # inputs it got through; the rest go to another host
+        while len(results) < len(inputs):
+            remaining = inputs[len(results):]
+            try:
+                reply = self._host_pool().request(
+                    {"op": "run", "dir": class_dir, "class": main_class, "inputs": remaining, "timeout": timeout},
+                    timeout * len(remaining) + 2,
+                )
+            except WorkerFailure as e:
+                return results + failed_runs(e, remaining, timeout)
+            if not reply:
+                return results + failed_runs(WorkerFailure("Java host exited without a result"), remaining, timeout)
+            results.extend(reply)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "classes": self.cache.stats(),
+            **(self._pool.stats() if self._pool is not None else {}),
+        }
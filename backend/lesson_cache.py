@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+
+def prompt_cache_key(prompt: str, model_name: str) -> str:
+    """Content address for a model generation.
+
+    The key hashes the fully formatted prompt (topic, lesson index, title and the
+    prompt template itself) together with the model name, so editing the template
+    or switching models naturally stops serving old lessons.
+    """
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LRUTextCache:
+    """Thread-safe in-process LRU for text values, bounded by total UTF-8 bytes"""
+
+    @staticmethod
+    def _sizeof(value) -> int:
+        return len(value.encode("utf-8"))
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            self._items.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, text: str):
+        nbytes = self._sizeof(text)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._items[key] = (text, nbytes)
+            self.size += nbytes
+            # Evict least recently used entries until we fit the byte budget
+            while self.size > self.max_bytes and self._items:
+                _, (_, evicted_bytes) = self._items.popitem(last=False)
+                self.size -= evicted_bytes
+
+    def __len__(self):
+        return len(self._items)
+
+
+class LRUBytesCache(LRUTextCache):
+    """The same LRU for bytes values, such as rendered PDFs"""
+
+    _sizeof = staticmethod(len)
+
+
+class LessonCache:
+    """Two-level lesson cache: in-process LRU in front of a MongoDB collection.
+
+    Lessons are shared between every student requesting the same (topic, lesson,
+    title) with the same prompt and model. MongoDB failures are logged and treated
+    as misses so the cache can never break lesson delivery.
+    """
+
+    def __init__(self, collection, max_bytes: int = 64 * 1024 * 1024):
+        self.collection = collection
+        self.memory = LRUTextCache(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        text = self.memory.get(key)
+        if text is None:
+            try:
+                doc = self.collection.find_one({"_id": key}, {"text": 1})
+            except Exception as e:
+                print(f"Lesson cache read error: {e}")
+                doc = None
+            if doc:
+                text = doc["text"]
+                self.memory.put(key, text)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str, **meta):
+        self.memory.put(key, text)
+        try:
+            self.collection.update_one(
+                {"_id": key},
+                {
+                    "$set": {"text": text, **meta},
+                    "$setOnInsert": {"created_at": datetime.now()},
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Lesson cache write error: {e}")
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Async lookup: memory hits stay on the loop, MongoDB reads go to a thread"""
+        text = self.memory.get(key)
+        if text is not None:
+            self.hits += 1
+            return text
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, text: str, **meta):
+        await asyncio.to_thread(self.put, key, text, **meta)
+
+
+def replay_chunks(text: str, chunk_size: int = 1024):
+    """Split cached lesson text into stream-sized pieces on line boundaries"""
+    buf = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        buf.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield "".join(buf)
@@ -0,0 +1,265 @@
+import os
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import pwd
+    import resource
+except ImportError:  # Windows: no rlimits or users, only the wall-clock timeout applies
+    pwd = resource = None
+
+# Bytes of stdout (and, separately, stderr) kept per run; the process is killed past this
+MAX_OUTPUT_BYTES = int(os.getenv("SANDBOX_MAX_OUTPUT_BYTES", 1024 * 1024))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", 512))
+# RLIMIT_NPROC counts every process and thread of the server's user, not just the run's own
+SANDBOX_MAX_PROCESSES = int(os.getenv("SANDBOX_MAX_PROCESSES", 64))
+
+
+PRLIMIT = shutil.which("prlimit")
+# Fallback exec wrapper where util-linux prlimit is missing: set the limits, then exec the command
+RLIMIT_EXEC = r"""
+import os, resource, sys
+for spec in sys.argv[1].split(","):
+    name, _, value = spec.partition("=")
+    soft, hard = value.split(":")
+    resource.setrlimit(getattr(resource, "RLIMIT_" + name.upper()), (int(soft), int(hard)))
+os.execvp(sys.argv[2], sys.argv[2:])
+"""
+
+
+def limited_command(cmd: list, cpu_seconds: int = None, memory_mb: int = SANDBOX_MEMORY_MB,
+                    max_processes: int = SANDBOX_MAX_PROCESSES, no_writes: bool = True) -> list:
+    """`cmd` behind an exec wrapper that applies the run's rlimits: CPU seconds, address
+    space, process count, no file writes, no core dumps. Pass None to leave a limit off
+    (runtimes like the JVM and node reserve large address space and start threads).
+
+    The limits are set by the wrapper rather than a preexec_fn, which is not safe to run
+    in the forked child of a threaded server.
+    """
+    if resource is None:
+        return list(cmd)
+    limits = []
+    if cpu_seconds is not None:
+        limits.append(("cpu", cpu_seconds, cpu_seconds + 1))
+    if memory_mb is not None:
+        limits.append(("as", memory_mb * 1024 * 1024, memory_mb * 1024 * 1024))
+    if max_processes is not None:
+        limits.append(("nproc", max_processes, max_processes))
+    if no_writes:
+        limits.append(("fsize", 0, 0))
+    limits.append(("core", 0, 0))
+    if PRLIMIT:
+        return [PRLIMIT, *(f"--{name}={soft}:{hard}" for name, soft, hard in limits), "--", *cmd]
+    specs = ",".join(f"{name}={soft}:{hard}" for name, soft, hard in limits)
+    return [sys.executable, "-I", "-S", "-c", RLIMIT_EXEC, specs, *cmd]
+
+
+def _sandbox_credentials() -> dict:
+    """Popen arguments that run a program as SANDBOX_USER; empty unless the server may switch users"""
+    name = os.getenv("SANDBOX_USER", "nobody")
+    if not name or pwd is None or os.geteuid() != 0:
+        return {}
+    try:
+        entry = pwd.getpwnam(name)
+    except KeyError:
+        print(f"Sandbox user {name!r} does not exist; isolated runs keep the server's user")
+        return {}
+    return {"user": entry.pw_uid, "group": entry.pw_gid, "extra_groups": []}
+
+
+# Isolated runs (untrusted native binaries) get their own user, an empty
+# working directory and none of the server's environment (API keys, Mongo URI)
+SANDBOX_CREDENTIALS = _sandbox_credentials()
+SANDBOX_ENV = {"PATH": os.defpath, "LANG": "C.UTF-8"}
+
+
+def _reachable_by_others(path: str) -> bool:
+    """Whether any user may run `path`: the file and every directory above it are o+x"""
+    path = os.path.realpath(path)
+    while True:
+        try:
+            if not os.stat(path).st_mode & stat.S_IXOTH:
+                return False
+        except OSError:
+            return False
+        parent = os.path.dirname(path)
+        if parent == path:
+            return True
+        path = parent
+
+
+def sandbox_popen_args(executable: str) -> dict:
+    """Popen arguments for a long-lived sandbox process running `executable`: SANDBOX_ENV,
+    plus SANDBOX_USER when that user can run the file (an interpreter inside a private
+    home directory cannot be run as another user; point SANDBOX_PYTHON elsewhere)"""
+    if SANDBOX_CREDENTIALS and not _reachable_by_others(executable):
+        print(f"Sandbox user cannot run {executable}; sandbox workers keep the server's user")
+        return {"env": SANDBOX_ENV}
+    return {"env": SANDBOX_ENV, **SANDBOX_CREDENTIALS}
+
+
+def peak_rss_kb(pid="self"):
+    """High-water resident set size of a live process in KB (Linux only, else None)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _current_rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _kill_group(proc):
+    """Kill the run and anything it started (it leads its own session)"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (OSError, AttributeError):
+        proc.kill()
+
+
+def _wait_with_usage(proc, timeout: int, floor):
+    """Reap `proc` within `timeout` seconds: (timed out, cpu seconds, peak RSS in KB).
+
+    A forked child inherits the server's memory footprint (`floor`) as the
+    floor of its ru_maxrss, so the peak is also sampled from /proc while the
+    child runs and ru_maxrss is trusted only once it exceeds that floor.
+    """
+    deadline = time.perf_counter() + timeout
+    delay = 0.0005
+    sampled = None
+    timed_out = False
+    while True:
+        sampled = max(filter(None, [sampled, peak_rss_kb(proc.pid)]), default=None)
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.perf_counter() >= deadline:
+            timed_out = True
+            _kill_group(proc)
+            _, status, usage = os.wait4(proc.pid, 0)
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    reported = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    if floor is None:
+        max_rss = reported  # no /proc to sample; report what the kernel gives
+    else:
+        max_rss = max(filter(None, [sampled, reported if reported > floor else None]), default=None)
+    return timed_out, round(usage.ru_utime + usage.ru_stime, 3), max_rss
+
+
+def _drain(stream, sink: bytearray, cap: int, on_overflow):
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            return
+        room = cap - len(sink)
+        if room > 0:
+            sink.extend(chunk[:room])
+        if len(chunk) > room:
+            on_overflow()
+            return
+
+
+def _feed(stream, data: bytes):
+    try:
+        if data:
+            stream.write(data)
+        stream.close()
+    except (BrokenPipeError, OSError, ValueError):
+        pass  # the program exited (or was killed) without reading all of its input
+
+
+def run_with_limits(cmd: list, input_data: str = None, timeout: int = 5,
+                    max_output_bytes: int = MAX_OUTPUT_BYTES, cwd: str = None, isolated: bool = False) -> dict:
+    """Run `cmd` with a wall-clock timeout and bounded, streamed stdout/stderr capture.
+
+    Output beyond `max_output_bytes` is dropped and the process killed, so a
+    print loop costs the server at most the cap. Stdin is fed from its own
+    thread, so a program that never reads it still times out. `isolated` runs
+    in a fresh empty directory as SANDBOX_USER with a scrubbed environment.
+    Rlimits come from wrapping `cmd` with `limited_command`. `cpu_time` is in
+    seconds and `max_rss` in KB; both are None where the platform cannot
+    measure them.
+    """
+    if isolated:
+        workdir = tempfile.mkdtemp(prefix="run-")
+        os.chmod(workdir, 0o755)
+        try:
+            return _run(cmd, input_data, timeout, max_output_bytes, workdir,
+                        {"env": SANDBOX_ENV, **SANDBOX_CREDENTIALS})
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return _run(cmd, input_data, timeout, max_output_bytes, cwd or tempfile.gettempdir(), {})
+
+
+def _run(cmd: list, input_data: str, timeout: int, max_output_bytes: int, cwd: str, popen_args: dict) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=hasattr(os, "killpg"),
+        **popen_args,
+    )
+    floor = _current_rss_kb()
+    out, err = bytearray(), bytearray()
+    truncated = threading.Event()
+
+    def overflow():
+        truncated.set()
+        _kill_group(proc)
+
+    threads = [
+        threading.Thread(target=_drain, args=(proc.stdout, out, max_output_bytes, overflow), daemon=True),
+        threading.Thread(target=_drain, args=(proc.stderr, err, max_output_bytes, overflow), daemon=True),
+        threading.Thread(target=_feed, args=(proc.stdin, (input_data or "").encode("utf-8")), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    if hasattr(os, "wait4"):
+        timed_out, cpu_time, max_rss = _wait_with_usage(proc, timeout, floor)
+    else:
+        cpu_time = max_rss = None
+        timed_out = False
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            proc.kill()
+            proc.wait()
+    if hasattr(os, "killpg"):
+        # Background children it left behind would hold the pipes open
+        _kill_group(proc)
+    for thread in threads:
+        thread.join(timeout=1)
+    return {
+        "output": out.decode("utf-8", errors="replace"),
+        "error": err.decode("utf-8", errors="replace"),
+        "exit_code": proc.returncode,
+        "timed_out": timed_out,
+        "output_truncated": truncated.is_set(),
+        "cpu_time": cpu_time,
+        "max_rss": max_rss,
+        "execution_time": round(time.perf_counter() - start, 3),
+    }
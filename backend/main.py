@@ -1,31 +1,32 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from backend.core import workflow, generate_lesson_text_stream
+from backend.core import (
+    workflow, generate_lesson_text, generate_lesson_text_stream, gemini_generate, intent_router,
+    is_llm_error, safe_json_parse, prefetcher, prefetch_after_lesson, MODEL_NAME
+)
+from backend.lesson_cache import prompt_cache_key
+import asyncio
 import os
-import tempfile
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 import re
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-from pymongo import MongoClient
 from dotenv import load_dotenv
 import json
+import hashlib
 from bson import ObjectId
-import subprocess
-import tempfile
-import os
-import sys
-import signal
 import threading
 import time
-from backend.roadmap import roadmap_workflow
+from backend.course_export import CourseExportJobs
+from backend.markdown_chunker import MarkdownBlockChunker
+from backend.notes_pdf import notes_pdf
+from backend.roadmap import roadmap_cache
+from backend.sandbox import (
+    execute_code_safely, find_security_violation, grade_coding_answers, normalize_output, precompile, run_case,
+    run_succeeded, python_workers, java_runner, native_runner
+)
+from backend import db
 
 app = FastAPI()
 
@@ -40,9 +41,20 @@ app.add_middleware(
 # Load environment variables
 load_dotenv()
 
-# MongoDB connection
-client = MongoClient(os.getenv("MONGO_CLIENT"))
-db = client["learning_platform"]
+@app.on_event("startup")
+async def prepare_database():
+    """Create indexes, run one-off backfills and report query plans for the hot read paths"""
+    await asyncio.to_thread(db.ensure_indexes)
+    await asyncio.to_thread(db.backfill_user_stats)
+    if os.getenv("MONGO_EXPLAIN_ON_STARTUP", "1") == "1":
+        await asyncio.to_thread(db.explain_hot_queries)
+
+@app.on_event("startup")
+def start_sandbox():
+    """Pre-fork the warm interpreter pools so the first /execute-code is not cold"""
+    python_workers.start()
+    # Building the JVM host runs javac once; keep it off the startup path
+    threading.Thread(target=java_runner.start, daemon=True).start()
 
 # Custom JSON encoder for MongoDB objects
 class MongoDBEncoder(json.JSONEncoder):
@@ -68,6 +80,10 @@ class PDFQuery(BaseModel):
     topic: str
     lesson_title: str
 
+class CourseExportRequest(BaseModel):
+    thread_id: str
+    lesson_indices: Optional[List[int]] = None  # default: the whole syllabus
+
 class QuizGenerationRequest(BaseModel):
     lesson_content: str
     topic: str
@@ -75,6 +91,11 @@ class QuizGenerationRequest(BaseModel):
     lesson_index: int
     user_id: str = "default_user"
 
+class CourseQuizRequest(BaseModel):
+    thread_id: str  # the course session whose syllabus to cover
+    user_id: str = "default_user"
+    lesson_indices: Optional[List[int]] = None  # default: every lesson
+
 class QuizSubmission(BaseModel):
     quiz_id: str
     user_id: str = "default_user"
@@ -87,12 +108,25 @@ class PerformanceRequest(BaseModel):
     user_id: str = "default_user"
     topic: Optional[str] = None
 
+class QuizHistoryRequest(BaseModel):
+    user_id: str = "default_user"
+    topic: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: int = 20
+
 class CodeExecutionRequest(BaseModel):
     code: str
     language: str = "python"
     input_data: Optional[str] = None
     timeout: int = 5  # seconds
 
+class BatchExecutionRequest(BaseModel):
+    code: str
+    language: str = "python"
+    test_cases: List[Dict[str, Any]]  # [{"input": "...", "expected_output": "..." (optional)}]
+    timeout: int = 5  # seconds, per case
+    concurrency: Optional[int] = None
+
 class skillRequest(BaseModel):
     skill: str
 
@@ -100,15 +134,21 @@ class LessonStreamRequest(BaseModel):
     topic: str
     lesson_index: int
     lesson_title: str
+    thread_id: Optional[str] = None  # enables next-lesson prefetch
 
 @app.post("/roadmap")
-def get_roadmap(request: skillRequest):
-    state = {"skill": request.skill}
-    result = roadmap_workflow.invoke(state, config={"configurable": {"thread_id": "1"}})
-    return {"roadmap": result["roadmap"]}
+async def get_roadmap(request: skillRequest):
+    try:
+        return {"roadmap": await roadmap_cache.get(request.skill)}
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+@app.get("/roadmap-stats")
+def roadmap_stats():
+    return {"success": True, **roadmap_cache.stats()}
 
 @app.post("/course")
-def course(stu_query: LectureQuery):
+async def course(stu_query: LectureQuery):
     query = stu_query.query
     thread_id = stu_query.thread_id
 
@@ -116,7 +156,7 @@ def course(stu_query: LectureQuery):
     state = {"query": query}
 
     try:
-        result = workflow.invoke(state, config=config)
+        result = await workflow.ainvoke(state, config=config)
         return {
             "success": True, 
             "response": result.get("response", ""),
@@ -130,59 +170,39 @@ def course(stu_query: LectureQuery):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def _chunk_markdown_preserving_blocks(text: str, max_chunk_len: int = 1500):
-    """Yield markdown chunks without breaking headings or fenced code blocks."""
-    if not text:
-        return
-    lines = text.split('\n')
-    chunks = []
-    buf = []
-    in_code = False
-    fence = None
-    current_len = 0
-    def flush():
-        nonlocal buf, current_len
-        if buf:
-            chunk = '\n'.join(buf).strip('\n')
-            if chunk:
-                chunks.append(chunk)
-            buf = []
-            current_len = 0
-    for line in lines:
-        # detect fenced code start/end
-        if re.match(r"^```", line):
-            in_code = not in_code
-            fence = '```' if in_code else None
-            buf.append(line)
-            current_len += len(line) + 1
-            continue
-        # if starting a new top-level block (heading or hr) and buffer has content, flush first
-        if not in_code and (re.match(r"^#{1,6}\\s", line) or re.match(r"^---+$", line.strip())):
-            flush()
-            buf.append(line)
-            current_len += len(line) + 1
-            continue
-        # normal line accumulation
-        buf.append(line)
-        current_len += len(line) + 1
-        # split only on blank line when not inside code and chunk too large
-        if not in_code and current_len >= max_chunk_len and line.strip() == "":
-            flush()
-    flush()
-    for c in chunks:
-        yield c
+@app.get("/router-stats")
+def router_stats():
+    """How many tutor queries the local intent router answered without an LLM call"""
+    return {"success": True, **intent_router.stats()}
+
+@app.get("/prefetch-stats")
+def prefetch_stats():
+    return {"success": True, **prefetcher.stats()}
+
+@app.on_event("shutdown")
+def stop_course_exports():
+    course_exports.shutdown()
+
+@app.get("/sandbox-stats")
+def sandbox_stats():
+    return {"success": True, "python": python_workers.stats(), "java": java_runner.stats(),
+            "native": native_runner.stats()}
 
 @app.post("/course-stream")
-def course_stream(stu_query: LectureQuery):
+async def course_stream(stu_query: LectureQuery, http_request: Request):
     query = stu_query.query
     thread_id = stu_query.thread_id
 
-    config = {"configurable": {"thread_id": thread_id}}
+    # Lesson bodies are streamed below instead of being rendered inside the graph
+    config = {"configurable": {"thread_id": thread_id, "defer_lessons": True}}
     state = {"query": query}
 
-    def generator():
+    async def generator():
+        stream = None
         try:
-            result = workflow.invoke(state, config=config)
+            # Returns as soon as the syllabus is parsed; lesson generation is
+            # already running in the background by then
+            result = await workflow.ainvoke(state, config=config)
             meta = {
                 "type": "meta",
                 "success": True,
@@ -194,22 +214,47 @@ def course_stream(stu_query: LectureQuery):
             }
             yield json.dumps(meta) + "\n"
 
-            # 🎯 FIXED: Don't stream the full course content, just return metadata
-            # The frontend will handle streaming individual lessons
+            # Course intro / lesson header, or the whole answer for concept queries
+            if result.get("response"):
+                yield json.dumps({"type": "chunk", "markdown": result["response"]}) + "\n"
+
+            pending = result.get("pending_lesson")
+            if pending is not None:
+                lesson_title = result["syllabus"][pending]["title"]
+                yield json.dumps({
+                    "type": "lesson",
+                    "lesson_index": pending,
+                    "lesson_title": lesson_title
+                }) + "\n"
+                # Attaches to the generation started by the graph (or the cache)
+                stream = await generate_lesson_text_stream(result["topic"], pending, lesson_title)
+                chunker = MarkdownBlockChunker()
+                async for chunk in stream:
+                    if await http_request.is_disconnected():
+                        return
+                    for block in chunker.feed(chunk):
+                        yield json.dumps({"type": "chunk", "markdown": block}) + "\n"
+                for block in chunker.close():
+                    yield json.dumps({"type": "chunk", "markdown": block}) + "\n"
+
             yield json.dumps({"type": "done"}) + "\n"
         except Exception as e:
             yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            if stream is not None:
+                stream.cancel()
 
     return StreamingResponse(generator(), media_type="application/x-ndjson")
 
 @app.post("/lesson-stream")
-def lesson_stream(request: LessonStreamRequest):
+async def lesson_stream(request: LessonStreamRequest, http_request: Request):
     """Stream lesson content with proper formatting"""
     topic = request.topic
     lesson_index = request.lesson_index
     lesson_title = request.lesson_title
 
-    def generator():
+    async def generator():
+        stream = None
         try:
             # Send initial metadata
             meta = {
@@ -221,23 +266,39 @@ def lesson_stream(request: LessonStreamRequest):
             }
             yield json.dumps(meta) + "\n"
 
-            # Stream lesson content
-            chunks = generate_lesson_text_stream(topic, lesson_index, lesson_title)
-            for chunk in chunks:
-                yield json.dumps({"type": "chunk", "markdown": chunk}) + "\n"
+            # Gemini's chunks are regrouped into whole markdown blocks (a fence or
+            # heading is never split), each sent as soon as it is complete; awaiting
+            # the send applies the client's backpressure to this subscription
+            stream = await generate_lesson_text_stream(topic, lesson_index, lesson_title)
+            chunker = MarkdownBlockChunker()
+            async for chunk in stream:
+                if await http_request.is_disconnected():
+                    print(f"Client left lesson stream for '{lesson_title}', cancelling generation")
+                    return
+                for block in chunker.feed(chunk):
+                    yield json.dumps({"type": "chunk", "markdown": block}) + "\n"
+            for block in chunker.close():
+                yield json.dumps({"type": "chunk", "markdown": block}) + "\n"
             
             yield json.dumps({"type": "done"}) + "\n"
+
+            # Lesson served: get the next one ready while the student reads
+            if request.thread_id:
+                await prefetch_after_lesson(request.thread_id, topic, lesson_index)
         except Exception as e:
             yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            # Runs on normal completion, disconnect and task cancellation alike
+            if stream is not None:
+                stream.cancel()
 
     return StreamingResponse(generator(), media_type="application/x-ndjson")
 
 @app.post("/doubt")
-def handle_doubt(doubt_query: DoubtQuery):
+async def handle_doubt(doubt_query: DoubtQuery):
     doubt = doubt_query.doubt
     lesson_context = doubt_query.lesson_context
     topic = doubt_query.topic
-    thread_id = doubt_query.thread_id
 
     try:
         # Create a context-aware doubt prompt
@@ -259,206 +320,27 @@ def handle_doubt(doubt_query: DoubtQuery):
         Keep your answer focused and practical, drawing from the lesson context when possible.
         """
         
-        # Use the existing workflow but with the doubt prompt
-        config = {"configurable": {"thread_id": f"{thread_id}_doubt"}}
-        state = {"query": doubt_prompt}
-        
-        result = workflow.invoke(state, config=config)
+        # Answered directly: a doubt is one-off, so nothing (least of all the
+        # lesson text in the prompt) belongs in a checkpointed session
+        answer = await gemini_generate(doubt_prompt)
+        if is_llm_error(answer):
+            return {"success": False, "error": answer}
         
         return {
             "success": True,
-            "answer": result.get("response", ""),
+            "answer": answer,
             "doubt": doubt,
             "topic": topic
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def clean_markdown_for_pdf(text):
-    """Clean markdown text for PDF generation"""
-    # Remove markdown headers and convert to plain text
-    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
-    # Remove markdown bold/italic
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-    text = re.sub(r'\*(.*?)\*', r'\1', text)
-    # Remove markdown code blocks
-    text = re.sub(r'```[\s\S]*?```', '', text)
-    text = re.sub(r'`([^`]+)`', r'\1', text)
-    # Remove markdown links
-    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
-    # Remove markdown lists
-    text = re.sub(r'^\s*[-*+]\s+', '• ', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*\d+\.\s+', '', text, flags=re.MULTILINE)
-    # Clean up extra whitespace
-    text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
-    return text.strip()
-
-def create_pdf(lesson_content, topic, lesson_title):
-    """Create a PDF from lesson content"""
-    # Create a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-    temp_file.close()
-    
-    # Create PDF document
-    doc = SimpleDocTemplate(temp_file.name, pagesize=A4, 
-                          rightMargin=72, leftMargin=72, 
-                          topMargin=72, bottomMargin=18)
-    
-    # Get styles
-    styles = getSampleStyleSheet()
-    
-    # Create custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    topic_style = ParagraphStyle(
-        'CustomTopic',
-        parent=styles['Heading2'],
-        fontSize=18,
-        spaceAfter=20,
-        alignment=TA_CENTER,
-        textColor=colors.darkgreen
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=12,
-        spaceBefore=20,
-        textColor=colors.darkblue
-    )
-    
-    subheading_style = ParagraphStyle(
-        'CustomSubHeading',
-        parent=styles['Heading3'],
-        fontSize=14,
-        spaceAfter=8,
-        spaceBefore=12,
-        textColor=colors.darkblue
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=6,
-        alignment=TA_JUSTIFY,
-        leading=14
-    )
-    
-    code_style = ParagraphStyle(
-        'CustomCode',
-        parent=styles['Code'],
-        fontSize=9,
-        spaceAfter=6,
-        spaceBefore=6,
-        leftIndent=20,
-        rightIndent=20,
-        backColor=colors.lightgrey
-    )
-    
-    # Clean the content
-    cleaned_content = clean_markdown_for_pdf(lesson_content)
-    
-    # Build the PDF content
-    story = []
-    
-    # Add title
-    story.append(Paragraph("GyaanSetu AI - Learning Notes", title_style))
-    story.append(Spacer(1, 12))
-    
-    # Add topic
-    story.append(Paragraph(f"Course: {topic}", topic_style))
-    story.append(Spacer(1, 12))
-    
-    # Add lesson title
-    story.append(Paragraph(f"Lesson: {lesson_title}", heading_style))
-    story.append(Spacer(1, 20))
-    
-    # Add content
-    lines = cleaned_content.split('\n')
-    current_code_block = []
-    in_code_block = False
-    
-    for line in lines:
-        line = line.strip()
-        
-        if not line:
-            if current_code_block:
-                # End code block
-                code_text = '\n'.join(current_code_block)
-                story.append(Paragraph(f"<font name='Courier'>{code_text}</font>", code_style))
-                current_code_block = []
-                in_code_block = False
-            story.append(Spacer(1, 6))
-            continue
-            
-        # Check for headings
-        if line.startswith('Lesson') or line.startswith('###') or line.startswith('##') or line.startswith('#'):
-            if current_code_block:
-                code_text = '\n'.join(current_code_block)
-                story.append(Paragraph(f"<font name='Courier'>{code_text}</font>", code_style))
-                current_code_block = []
-                in_code_block = False
-            
-            # Clean heading
-            heading = re.sub(r'^#+\s*', '', line)
-            if 'Lesson' in heading or '###' in line:
-                story.append(Paragraph(heading, heading_style))
-            else:
-                story.append(Paragraph(heading, subheading_style))
-        elif line.startswith('•') or line.startswith('-') or line.startswith('*'):
-            if current_code_block:
-                code_text = '\n'.join(current_code_block)
-                story.append(Paragraph(f"<font name='Courier'>{code_text}</font>", code_style))
-                current_code_block = []
-                in_code_block = False
-            story.append(Paragraph(f"• {line[1:].strip()}", body_style))
-        elif line.startswith('```') or line.startswith('`'):
-            if not in_code_block:
-                in_code_block = True
-            else:
-                in_code_block = False
-        elif in_code_block:
-            current_code_block.append(line)
-        else:
-            if current_code_block:
-                code_text = '\n'.join(current_code_block)
-                story.append(Paragraph(f"<font name='Courier'>{code_text}</font>", code_style))
-                current_code_block = []
-                in_code_block = False
-            story.append(Paragraph(line, body_style))
-    
-    # Handle any remaining code block
-    if current_code_block:
-        code_text = '\n'.join(current_code_block)
-        story.append(Paragraph(f"<font name='Courier'>{code_text}</font>", code_style))
-    
-    # Add footer
-    story.append(PageBreak())
-    story.append(Paragraph("Generated by GyaanSetu AI", 
-                          ParagraphStyle('Footer', parent=styles['Normal'], 
-                                       fontSize=10, alignment=TA_CENTER, 
-                                       textColor=colors.grey)))
-    
-    # Build PDF
-    doc.build(story)
-    
-    return temp_file.name
-
 @app.post("/download-notes")
 def download_notes(pdf_query: PDFQuery):
     """Generate and download PDF notes for the current lesson"""
     try:
-        # Create PDF
-        pdf_path = create_pdf(
+        # Create PDF (cached per lesson content)
+        pdf = notes_pdf(
             pdf_query.lesson_content,
             pdf_query.topic,
             pdf_query.lesson_title
@@ -469,21 +351,136 @@ def download_notes(pdf_query: PDFQuery):
         safe_lesson = re.sub(r'[^\w\s-]', '', pdf_query.lesson_title).strip()
         filename = f"{safe_topic}_{safe_lesson}_notes.pdf"
         
-        return FileResponse(
-            path=pdf_path,
-            filename=filename,
+        return StreamingResponse(
+            pdf_chunks(pdf),
             media_type='application/pdf',
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            headers={
+                "Content-Disposition": f"attachment; filename={filename}",
+                "Content-Length": str(len(pdf))
+            }
         )
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def pdf_chunks(pdf: bytes, chunk_size: int = 64 * 1024):
+    for start in range(0, len(pdf), chunk_size):
+        yield pdf[start:start + chunk_size]
+
+async def load_course_lesson(topic: str, index: int, title: str) -> str:
+    """Lesson text for an export, from the lesson cache (or generated into it)"""
+    lesson_text = await generate_lesson_text(topic, index, title)
+    if is_llm_error(lesson_text) or lesson_text.startswith("Sorry, couldn't"):
+        raise RuntimeError(lesson_text)
+    return lesson_text
+
+course_exports = CourseExportJobs(
+    load_course_lesson,
+    workers=int(os.getenv("COURSE_EXPORT_WORKERS", 2)),
+    lesson_concurrency=int(os.getenv("COURSE_EXPORT_LESSON_CONCURRENCY", 4)),
+    max_running=int(os.getenv("COURSE_EXPORT_MAX_RUNNING", 4))
+)
+
+@app.post("/course-export")
+async def start_course_export(request: CourseExportRequest):
+    """Start building one PDF for a whole course; poll or follow the returned job"""
+    snapshot = await workflow.aget_state({"configurable": {"thread_id": request.thread_id}})
+    values = snapshot.values or {}
+    topic = values.get("topic")
+    syllabus = values.get("syllabus") or []
+    if not topic or not syllabus:
+        return {"success": False, "error": "No course in progress for this thread_id"}
+
+    if request.lesson_indices is None:
+        indices = list(range(len(syllabus)))
+    else:
+        indices = sorted({i for i in request.lesson_indices if 0 <= i < len(syllabus)})
+    if not indices:
+        return {"success": False, "error": "No lessons selected"}
+    job = course_exports.start(topic, [(i, syllabus[i]["title"]) for i in indices])
+    if job is None:
+        return {"success": False, "error": "Too many course exports in progress, try again shortly"}
+    return {"success": True, **course_exports.snapshot(job)}
+
+@app.get("/course-export/{job_id}")
+def course_export_status(job_id: str):
+    job = course_exports.get(job_id)
+    if job is None:
+        return {"success": False, "error": "Unknown or expired export job"}
+    return {"success": True, **course_exports.snapshot(job)}
+
+@app.get("/course-export/{job_id}/events")
+async def course_export_events(job_id: str, http_request: Request):
+    """Job progress as NDJSON, one snapshot per finished lesson, until the export is done"""
+    job = course_exports.get(job_id)
+    if job is None:
+        return {"success": False, "error": "Unknown or expired export job"}
+
+    async def generator():
+        async for event in course_exports.events(job):
+            yield json.dumps(event) + "\n"
+            if await http_request.is_disconnected():
+                return
+
+    return StreamingResponse(generator(), media_type="application/x-ndjson")
+
+@app.get("/course-export/{job_id}/pdf")
+def course_export_pdf(job_id: str):
+    job = course_exports.get(job_id)
+    if job is None:
+        return {"success": False, "error": "Unknown or expired export job"}
+    if job["status"] != "done":
+        return {"success": False, "error": f"Export is {job['status']}", **course_exports.snapshot(job)}
+    pdf = job["pdf"]
+    safe_topic = re.sub(r'[^\w\s-]', '', job["topic"]).strip()
+    filename = f"{safe_topic}_course_notes.pdf"
+    return StreamingResponse(
+        pdf_chunks(pdf),
+        media_type='application/pdf',
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(len(pdf))
+        }
+    )
+
 # Quiz Generation Function
-def generate_quiz_questions(lesson_content: str, topic: str, lesson_title: str) -> List[Dict[str, Any]]:
-    """Generate quiz questions using LLM based on lesson content"""
+def _validate_question(q) -> Optional[Dict[str, Any]]:
+    """Normalize one generated question; None if it cannot be graded"""
+    if not isinstance(q, dict) or not q.get('question') or q.get('type') not in ('mcq', 'coding'):
+        return None
+    if q['type'] == 'mcq':
+        options = q.get('options')
+        answer = q.get('correct_answer')
+        if not isinstance(options, list) or len(options) < 2:
+            return None
+        if not isinstance(answer, int) or not 0 <= answer < len(options):
+            return None
+    return {
+        'question': q['question'],
+        'type': q['type'],
+        'options': q.get('options', []) if q['type'] == 'mcq' else None,
+        'expected_output': q.get('expected_output') if q['type'] == 'coding' else None,
+        'test_cases': [
+            {'input': str(case.get('input') or ''), 'expected_output': case.get('expected_output')}
+            for case in q.get('test_cases') or [] if isinstance(case, dict)
+        ] if q['type'] == 'coding' else None,
+        'correct_answer': q.get('correct_answer'),
+        'explanation': q.get('explanation', ''),
+        'difficulty': q.get('difficulty', 'medium')
+    }
+
+def parse_quiz_questions(text: str) -> List[Dict[str, Any]]:
+    """Questions from model output: a JSON array, or an object wrapping one"""
+    parsed = safe_json_parse(text)
+    if isinstance(parsed, dict):
+        parsed = parsed.get('questions')
+    if not isinstance(parsed, list):
+        return []
+    return [q for q in map(_validate_question, parsed) if q][:5]  # Limit to 5 questions
+
+async def generate_quiz_questions(lesson_content: str, topic: str, lesson_title: str) -> List[Dict[str, Any]]:
+    """Generate quiz questions using LLM based on lesson content.
+    Question sets are banked per (topic, lesson_title, lesson content hash)."""
     try:
-        from backend.core import model
-        
         quiz_prompt = f"""
         You are an expert educator creating a comprehensive quiz for the lesson: "{lesson_title}" in the course "{topic}".
 
@@ -511,36 +508,45 @@ def generate_quiz_questions(lesson_content: str, topic: str, lesson_title: str)
                 "difficulty": "medium"
             }},
             {{
-                "question": "Write a function that...",
+                "question": "Write a program that reads ... from standard input and prints ...",
                 "type": "coding",
-                "expected_output": "Expected result",
-                "correct_answer": "def example(): return 'result'",
+                "expected_output": "Exact output for the first test case",
+                "test_cases": [
+                    {{"input": "stdin for case 1", "expected_output": "exact stdout for case 1"}},
+                    {{"input": "stdin for case 2", "expected_output": "exact stdout for case 2"}}
+                ],
+                "correct_answer": "n = int(input())\\nprint(n * 2)",
                 "explanation": "This solution works because...",
                 "difficulty": "hard"
             }}
         ]
 
+        Coding questions are graded by running the learner's Python program: it reads
+        the test case input from stdin and must print exactly the expected output.
+        Give 2-4 test cases and a complete reference program as "correct_answer".
+
         Focus on the most important concepts from the lesson. Make questions practical and applicable.
         """
         
-        response = model.invoke(quiz_prompt)
-        questions = json.loads(response.content.strip())
-        
-        # Validate and clean questions
-        validated_questions = []
-        for q in questions:
-            if isinstance(q, dict) and 'question' in q and 'type' in q:
-                validated_questions.append({
-                    'question': q['question'],
-                    'type': q.get('type', 'mcq'),
-                    'options': q.get('options', []) if q.get('type') == 'mcq' else None,
-                    'expected_output': q.get('expected_output') if q.get('type') == 'coding' else None,
-                    'correct_answer': q.get('correct_answer'),
-                    'explanation': q.get('explanation', ''),
-                    'difficulty': q.get('difficulty', 'medium')
-                })
-        
-        return validated_questions[:5]  # Limit to 5 questions
+        # The formatted prompt is a function of exactly (topic, title, content)
+        # and the template, so its hash doubles as the bank key
+        bank_key = prompt_cache_key(quiz_prompt, MODEL_NAME)
+        banked = await asyncio.to_thread(db.get_bank_questions, bank_key)
+        if banked:
+            return banked
+        
+        response = await gemini_generate(quiz_prompt, json_mode=True)
+        if is_llm_error(response):
+            raise ValueError(response)
+        questions = parse_quiz_questions(response)
+        if not questions:
+            raise ValueError("model returned no usable questions")
+        
+        content_hash = hashlib.sha256(lesson_content.encode("utf-8")).hexdigest()
+        await asyncio.to_thread(
+            db.save_bank_questions, bank_key, topic, lesson_title, content_hash, questions
+        )
+        return questions
         
     except Exception as e:
         print(f"Error generating quiz: {e}")
@@ -556,29 +562,34 @@ def generate_quiz_questions(lesson_content: str, topic: str, lesson_title: str)
             }
         ]
 
+def build_quiz_doc(user_id: str, topic: str, lesson_title: str, lesson_index: int, questions: list) -> dict:
+    return {
+        "quiz_id": f"{user_id}_{topic}_{lesson_index}_{datetime.now().timestamp()}",
+        "user_id": user_id,
+        "topic": topic,
+        "lesson_title": lesson_title,
+        "lesson_index": lesson_index,
+        "questions": questions,
+        "created_at": datetime.now(),
+        "total_questions": len(questions)
+    }
+
 @app.post("/generate-quiz")
-def generate_quiz(request: QuizGenerationRequest):
+async def generate_quiz(request: QuizGenerationRequest):
     """Generate quiz questions for a lesson"""
     try:
-        questions = generate_quiz_questions(
+        questions = await generate_quiz_questions(
             request.lesson_content,
             request.topic,
             request.lesson_title
         )
         
         # Save quiz to database
-        quiz_doc = {
-            "quiz_id": f"{request.user_id}_{request.topic}_{request.lesson_index}_{datetime.now().timestamp()}",
-            "user_id": request.user_id,
-            "topic": request.topic,
-            "lesson_title": request.lesson_title,
-            "lesson_index": request.lesson_index,
-            "questions": questions,
-            "created_at": datetime.now(),
-            "total_questions": len(questions)
-        }
+        quiz_doc = build_quiz_doc(
+            request.user_id, request.topic, request.lesson_title, request.lesson_index, questions
+        )
         
-        db.quizzes.insert_one(quiz_doc)
+        await asyncio.to_thread(db.save_quiz, quiz_doc)
         
         return {
             "success": True,
@@ -590,12 +601,87 @@ def generate_quiz(request: QuizGenerationRequest):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# Upper bound on lessons being generated/quizzed at once by one batch request
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("QUIZ_BATCH_CONCURRENCY", 4))
+
+@app.post("/generate-course-quizzes")
+async def generate_course_quizzes(request: CourseQuizRequest, http_request: Request):
+    """Generate quizzes for every lesson of a course, streaming per-lesson progress as NDJSON"""
+    snapshot = await workflow.aget_state({"configurable": {"thread_id": request.thread_id}})
+    values = snapshot.values or {}
+    topic = values.get("topic")
+    syllabus = values.get("syllabus") or []
+    if not topic or not syllabus:
+        return {"success": False, "error": "No course in progress for this thread_id"}
+
+    if request.lesson_indices is None:
+        indices = list(range(len(syllabus)))
+    else:
+        indices = sorted({i for i in request.lesson_indices if 0 <= i < len(syllabus)})
+    limit = asyncio.Semaphore(QUIZ_BATCH_CONCURRENCY)
+
+    async def quiz_for_lesson(index: int) -> dict:
+        title = syllabus[index]["title"]
+        try:
+            async with limit:
+                # Lesson text comes from the lesson cache (or is generated into it)
+                lesson_text = await generate_lesson_text(topic, index, title)
+                if is_llm_error(lesson_text) or lesson_text.startswith("Sorry, couldn't"):
+                    return {"type": "error", "lesson_index": index, "lesson_title": title, "error": lesson_text}
+                questions = await generate_quiz_questions(lesson_text, topic, title)
+            return {"type": "quiz", "doc": build_quiz_doc(request.user_id, topic, title, index, questions)}
+        except Exception as e:
+            return {"type": "error", "lesson_index": index, "lesson_title": title, "error": str(e)}
+
+    async def generator():
+        tasks = [asyncio.ensure_future(quiz_for_lesson(i)) for i in indices]
+        docs = []
+        saved = False
+        try:
+            yield json.dumps({"type": "meta", "success": True, "topic": topic, "total": len(indices)}) + "\n"
+            for completed, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+                result = await next_done
+                if result["type"] == "quiz":
+                    doc = result["doc"]
+                    docs.append(doc)
+                    event = {
+                        "type": "progress",
+                        "lesson_index": doc["lesson_index"],
+                        "lesson_title": doc["lesson_title"],
+                        "quiz_id": doc["quiz_id"],
+                        "total_questions": doc["total_questions"],
+                    }
+                else:
+                    event = result
+                event["completed"] = completed
+                yield json.dumps(event) + "\n"
+                if await http_request.is_disconnected():
+                    break
+            # One round trip for the whole course
+            if docs:
+                await asyncio.to_thread(db.save_quizzes, docs)
+            saved = True
+            yield json.dumps({"type": "done", "saved": len(docs), "total": len(indices)}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Keep whatever was already generated if the client went away
+            if docs and not saved:
+                try:
+                    await asyncio.to_thread(db.save_quizzes, docs)
+                except Exception as e:
+                    print(f"Error saving course quizzes: {e}")
+
+    return StreamingResponse(generator(), media_type="application/x-ndjson")
+
 @app.post("/submit-quiz")
 def submit_quiz(submission: QuizSubmission):
     """Submit quiz answers and calculate score"""
     try:
         # Get the quiz from database
-        quiz = db.quizzes.find_one({"quiz_id": submission.quiz_id})
+        quiz = db.get_quiz(submission.quiz_id)
         if not quiz:
             return {"success": False, "error": "Quiz not found"}
         
@@ -604,32 +690,39 @@ def submit_quiz(submission: QuizSubmission):
         correct_answers = 0
         detailed_results = []
         
+        # Coding answers are run against their test cases, all questions in parallel
+        answered = submission.answers[:len(questions)]
+        coding = [i for i, answer in enumerate(answered) if questions[i]["type"] == "coding"]
+        gradings = dict(zip(coding, grade_coding_answers(
+            [(answered[i].get("answer"), questions[i]) for i in coding]
+        )))
+        
         # Calculate score
-        for i, answer in enumerate(submission.answers):
-            if i < len(questions):
-                question = questions[i]
-                user_answer = answer.get("answer")
-                correct_answer = question.get("correct_answer")
-                
-                is_correct = False
-                if question["type"] == "mcq":
-                    is_correct = user_answer == correct_answer
-                elif question["type"] == "coding":
-                    # For coding questions, we'll do basic string comparison
-                    # In a real implementation, you might want to run the code
-                    is_correct = str(user_answer).strip().lower() == str(correct_answer).strip().lower()
-                
-                if is_correct:
-                    correct_answers += 1
-                
-                detailed_results.append({
-                    "question_index": i,
-                    "question": question["question"],
-                    "user_answer": user_answer,
-                    "correct_answer": correct_answer,
-                    "is_correct": is_correct,
-                    "explanation": question.get("explanation", "")
-                })
+        for i, answer in enumerate(answered):
+            question = questions[i]
+            user_answer = answer.get("answer")
+            correct_answer = question.get("correct_answer")
+            
+            is_correct = False
+            if question["type"] == "mcq":
+                is_correct = user_answer == correct_answer
+            elif question["type"] == "coding":
+                is_correct = gradings[i]["is_correct"]
+            
+            if is_correct:
+                correct_answers += 1
+            
+            result = {
+                "question_index": i,
+                "question": question["question"],
+                "user_answer": user_answer,
+                "correct_answer": correct_answer,
+                "is_correct": is_correct,
+                "explanation": question.get("explanation", "")
+            }
+            if i in gradings:
+                result["grading"] = gradings[i]
+            detailed_results.append(result)
         
         score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
         
@@ -648,7 +741,8 @@ def submit_quiz(submission: QuizSubmission):
             "submitted_at": datetime.now()
         }
         
-        db.quiz_attempts.insert_one(attempt_doc)
+        db.save_quiz_attempt(attempt_doc)
+        db.record_attempt_stats(submission.user_id, submission.topic, score_percentage, attempt_doc["submitted_at"])
         
         # Determine recommendation based on score
         recommendation = "continue"
@@ -670,29 +764,24 @@ def submit_quiz(submission: QuizSubmission):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def attempt_to_json(attempt: dict) -> dict:
+    """Convert ObjectId and datetime to string for JSON serialization"""
+    if '_id' in attempt:
+        attempt['_id'] = str(attempt['_id'])
+    if 'submitted_at' in attempt and isinstance(attempt['submitted_at'], datetime):
+        attempt['submitted_at'] = attempt['submitted_at'].isoformat()
+    return attempt
+
 @app.post("/performance-dashboard")
 def get_performance_dashboard(request: PerformanceRequest):
     """Get user's performance dashboard data"""
     try:
         user_id = request.user_id
-        topic_filter = {"topic": request.topic} if request.topic else {}
-        
-        # Get all quiz attempts for the user
-        attempts_cursor = db.quiz_attempts.find({
-            "user_id": user_id,
-            **topic_filter
-        }).sort("submitted_at", -1)
-        
-        attempts = []
-        for attempt in attempts_cursor:
-            # Convert ObjectId and datetime to string for JSON serialization
-            if '_id' in attempt:
-                attempt['_id'] = str(attempt['_id'])
-            if 'submitted_at' in attempt and isinstance(attempt['submitted_at'], datetime):
-                attempt['submitted_at'] = attempt['submitted_at'].isoformat()
-            attempts.append(attempt)
-        
-        if not attempts:
+        
+        # Per-topic aggregates are maintained on submit; no attempt history scan
+        stats = db.summarize_user_stats(db.get_user_stats(user_id, request.topic))
+        
+        if not stats["total_attempts"]:
             return {
                 "success": True,
                 "total_quizzes": 0,
@@ -701,32 +790,23 @@ def get_performance_dashboard(request: PerformanceRequest):
                 "weak_areas": [],
                 "strong_areas": [],
                 "recent_attempts": [],
-                "recommendations": []
+                "recommendations": [],
+                "history_cursor": None
             }
         
-        # Calculate statistics
-        total_quizzes = len(attempts)
-        average_score = sum(attempt["score"] for attempt in attempts) / total_quizzes
-        
-        # Get unique topics
-        topics = list(set(attempt["topic"] for attempt in attempts))
-        
-        # Calculate topic-wise performance
-        topic_scores = {}
-        for topic in topics:
-            topic_attempts = [a for a in attempts if a["topic"] == topic]
-            topic_scores[topic] = sum(a["score"] for a in topic_attempts) / len(topic_attempts)
-        
-        # Identify weak and strong areas
-        weak_areas = [topic for topic, score in topic_scores.items() if score < 60]
-        strong_areas = [topic for topic, score in topic_scores.items() if score >= 80]
+        total_quizzes = stats["total_attempts"]
+        average_score = stats["average_score"]
+        topic_scores = stats["topic_scores"]
+        weak_areas = stats["weak_areas"]
+        strong_areas = stats["strong_areas"]
         
         # Calculate completion percentage (assuming each topic has multiple lessons)
         # This is a simplified calculation - in reality you'd track lesson completion
         completion_percentage = min(100, (total_quizzes * 10))  # Simplified calculation
         
-        # Get recent attempts
-        recent_attempts = attempts[:5]  # Last 5 attempts
+        # Get recent attempts; the cursor lets the client page through the rest via /quiz-history
+        recent, history_cursor = db.quiz_attempt_page(user_id, request.topic, limit=5)
+        recent_attempts = [attempt_to_json(attempt) for attempt in recent]
         
         # Generate recommendations
         recommendations = []
@@ -747,7 +827,8 @@ def get_performance_dashboard(request: PerformanceRequest):
             "strong_areas": strong_areas,
             "recent_attempts": recent_attempts,
             "recommendations": recommendations,
-            "topic_scores": topic_scores
+            "topic_scores": topic_scores,
+            "history_cursor": history_cursor
         }
         
     except Exception as e:
@@ -756,143 +837,61 @@ def get_performance_dashboard(request: PerformanceRequest):
         traceback.print_exc()
         return {"success": False, "error": str(e)}
 
-# Secure Code Execution Functions
-def execute_code_safely(code: str, language: str, input_data: str = None, timeout: int = 5):
-    """Execute code safely with timeout and resource limits"""
+@app.post("/quiz-history")
+def get_quiz_history(request: QuizHistoryRequest):
+    """Page through a user's quiz attempts, newest first"""
     try:
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(mode='w', suffix=get_file_extension(language), delete=False) as f:
-            f.write(code)
-            temp_file = f.name
-        
-        try:
-            # Prepare command based on language
-            if language.lower() == "python":
-                cmd = [sys.executable, temp_file]
-            elif language.lower() == "javascript":
-                cmd = ["node", temp_file]
-            elif language.lower() == "java":
-                # Compile first, then run
-                class_name = "Main"
-                compile_cmd = ["javac", temp_file]
-                compile_result = subprocess.run(compile_cmd, capture_output=True, text=True, timeout=timeout)
-                if compile_result.returncode != 0:
-                    return {
-                        "success": False,
-                        "output": "",
-                        "error": f"Compilation error: {compile_result.stderr}",
-                        "execution_time": 0
-                    }
-                cmd = ["java", "-cp", os.path.dirname(temp_file), class_name]
-            else:
-                return {
-                    "success": False,
-                    "output": "",
-                    "error": f"Unsupported language: {language}",
-                    "execution_time": 0
-                }
-            
-            # Execute with timeout
-            start_time = time.time()
-            result = subprocess.run(
-                cmd,
-                input=input_data,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                cwd=os.path.dirname(temp_file)
-            )
-            execution_time = time.time() - start_time
-            
-            # Clean up
-            os.unlink(temp_file)
-            if language.lower() == "java":
-                class_file = temp_file.replace('.java', '.class')
-                if os.path.exists(class_file):
-                    os.unlink(class_file)
-            
-            return {
-                "success": True,
-                "output": result.stdout,
-                "error": result.stderr if result.stderr else "",
-                "return_code": result.returncode,
-                "execution_time": round(execution_time, 3)
-            }
-            
-        except subprocess.TimeoutExpired:
-            os.unlink(temp_file)
-            return {
-                "success": False,
-                "output": "",
-                "error": f"Code execution timed out after {timeout} seconds",
-                "execution_time": timeout
-            }
-        except Exception as e:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-            return {
-                "success": False,
-                "output": "",
-                "error": f"Execution error: {str(e)}",
-                "execution_time": 0
-            }
-            
+        attempts, next_cursor = db.quiz_attempt_page(
+            request.user_id, request.topic, request.cursor, request.limit
+        )
+        return {
+            "success": True,
+            "attempts": [attempt_to_json(attempt) for attempt in attempts],
+            "next_cursor": next_cursor
+        }
     except Exception as e:
+        print(f"Error in quiz history: {e}")
+        return {"success": False, "error": str(e)}
+
+# Upper bound on a client-requested timeout, in seconds per run
+MAX_EXECUTION_TIMEOUT = int(os.getenv("MAX_EXECUTION_TIMEOUT", 10))
+
+def check_submission(code: str) -> Optional[dict]:
+    """Error response for code we refuse to run, None if it may run"""
+    if len(code) > 10000:  # 10KB limit
         return {
             "success": False,
             "output": "",
-            "error": f"System error: {str(e)}",
+            "error": "Code too long (max 10KB)",
             "execution_time": 0
         }
-
-def get_file_extension(language: str) -> str:
-    """Get file extension for the given language"""
-    extensions = {
-        "python": ".py",
-        "javascript": ".js",
-        "java": ".java",
-        "cpp": ".cpp",
-        "c": ".c"
-    }
-    return extensions.get(language.lower(), ".py")
+    
+    # Block dangerous operations
+    pattern = find_security_violation(code)
+    if pattern:
+        return {
+            "success": False,
+            "output": "",
+            "error": f"Security violation: '{pattern}' not allowed",
+            "execution_time": 0
+        }
+    return None
 
 @app.post("/execute-code")
 def execute_code(request: CodeExecutionRequest):
     """Execute code safely and return results"""
     try:
         # Security checks
-        if len(request.code) > 10000:  # 10KB limit
-            return {
-                "success": False,
-                "output": "",
-                "error": "Code too long (max 10KB)",
-                "execution_time": 0
-            }
-        
-        # Block dangerous operations
-        dangerous_patterns = [
-            "import os", "import sys", "import subprocess", "import shutil",
-            "open(", "file(", "__import__", "eval(", "exec(",
-            "os.system", "os.popen", "subprocess.", "shutil.",
-            "rm -rf", "del /", "format c:", "mkfs"
-        ]
-        
-        code_lower = request.code.lower()
-        for pattern in dangerous_patterns:
-            if pattern in code_lower:
-                return {
-                    "success": False,
-                    "output": "",
-                    "error": f"Security violation: '{pattern}' not allowed",
-                    "execution_time": 0
-                }
+        rejection = check_submission(request.code)
+        if rejection:
+            return rejection
         
         # Execute the code
         result = execute_code_safely(
             request.code,
             request.language,
             request.input_data,
-            request.timeout
+            max(1, min(request.timeout, MAX_EXECUTION_TIMEOUT))
         )
         
         return result
@@ -905,3 +904,81 @@ def execute_code(request: CodeExecutionRequest):
             "execution_time": 0
         }
 
+MAX_BATCH_CASES = 50
+# Cases of one batch running at once; the warm pools bound it globally as well
+EXECUTE_BATCH_CONCURRENCY = int(os.getenv("EXECUTE_BATCH_CONCURRENCY", 4))
+
+@app.post("/execute-batch")
+async def execute_batch(request: BatchExecutionRequest, http_request: Request):
+    """Run one program against many test inputs, streaming per-case results as NDJSON"""
+    rejection = check_submission(request.code)
+    if rejection:
+        return rejection
+    if not request.test_cases or len(request.test_cases) > MAX_BATCH_CASES:
+        return {"success": False, "error": f"Provide between 1 and {MAX_BATCH_CASES} test cases"}
+    
+    cases = [
+        {"input": str(case.get("input") or ""), "expected_output": case.get("expected_output")}
+        for case in request.test_cases
+    ]
+    timeout = max(1, min(request.timeout, MAX_EXECUTION_TIMEOUT))
+    limit = asyncio.Semaphore(max(1, min(request.concurrency or EXECUTE_BATCH_CONCURRENCY, EXECUTE_BATCH_CONCURRENCY)))
+    
+    async def run_one(index: int) -> dict:
+        case = cases[index]
+        async with limit:
+            result = await asyncio.to_thread(run_case, request.code, request.language, case["input"], timeout)
+        event = {
+            "type": "case",
+            "index": index,
+            "stdout": result.get("output", ""),
+            "stderr": result.get("error", ""),
+            "exit_code": result.get("exit_code"),
+            "execution_time": result.get("execution_time", 0),
+            "cpu_time": result.get("cpu_time"),
+            "max_rss": result.get("max_rss"),
+            "output_truncated": result.get("output_truncated", False),
+            "timed_out": result.get("timed_out", False),
+        }
+        if case["expected_output"] is not None:
+            event["passed"] = (
+                run_succeeded(result)
+                and normalize_output(result.get("output", "")) == normalize_output(case["expected_output"])
+            )
+        return event
+    
+    async def generator():
+        started = time.perf_counter()
+        tasks = []
+        try:
+            # Compiled languages are built once, before any case runs
+            compile_error = await asyncio.to_thread(precompile, request.code, request.language)
+            if compile_error is not None:
+                yield json.dumps({"type": "error", "error": f"Compilation error: {compile_error}"}) + "\n"
+                return
+            yield json.dumps({"type": "meta", "success": True, "total": len(cases)}) + "\n"
+            
+            tasks = [asyncio.ensure_future(run_one(i)) for i in range(len(cases))]
+            passed = 0
+            for next_done in asyncio.as_completed(tasks):
+                event = await next_done
+                passed += bool(event.get("passed"))
+                yield json.dumps(event) + "\n"
+                if await http_request.is_disconnected():
+                    return
+            
+            yield json.dumps({
+                "type": "done",
+                "total": len(cases),
+                "passed": passed,
+                "checked": sum(case["expected_output"] is not None for case in cases),
+                "wall_time": round(time.perf_counter() - started, 3)
+            }) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            # Cases still waiting for a slot never start
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(generator(), media_type="application/x-ndjson")
@@ -0,0 +1,76 @@
+import re
+
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+HEADING_RE = re.compile(r"^#{1,6}\s")
+RULE_RE = re.compile(r"^\s*---+\s*$")
+
+
+class MarkdownBlockChunker:
+    """Regroups streamed markdown into whole blocks.
+
+    `feed` takes text as it arrives and returns only complete blocks: a heading
+    or horizontal rule starts a new block, and a blank line outside a fenced
+    code block ends one once it holds at least `min_chunk_len` characters.
+    Fences and headings are never split, so a client can render each block
+    once and append it. Blocks are exact slices of the input, so joining
+    everything `feed` and `close` return reproduces the text.
+    """
+
+    def __init__(self, min_chunk_len: int = 0):
+        self.min_chunk_len = min_chunk_len
+        self._partial = []  # text after the last newline
+        self._block = []  # complete lines of the block being built
+        self._block_len = 0
+        self._in_code = False
+
+    def feed(self, text: str) -> list:
+        if "\n" not in text:
+            self._partial.append(text)
+            return []
+        self._partial.append(text)
+        lines = "".join(self._partial).split("\n")
+        self._partial = [lines.pop()]
+        blocks = []
+        for line in lines:
+            self._line(line + "\n", blocks)
+        return blocks
+
+    def close(self) -> list:
+        """Whatever is left once the stream has ended"""
+        blocks = []
+        rest = "".join(self._partial)
+        self._partial = []
+        if rest:
+            self._line(rest, blocks)
+        self._flush(blocks, final=True)
+        return blocks
+
+    def _line(self, line: str, blocks: list):
+        if FENCE_RE.match(line):
+            self._in_code = not self._in_code
+        elif not self._in_code:
+            # Right under a text line, "---" underlines a heading instead of being a rule
+            if HEADING_RE.match(line) or (RULE_RE.match(line) and self._after_blank()):
+                self._flush(blocks)
+            elif not line.strip() and self._block_len >= self.min_chunk_len:
+                self._append(line)
+                self._flush(blocks)
+                return
+        self._append(line)
+
+    def _after_blank(self) -> bool:
+        return not self._block or not self._block[-1].strip()
+
+    def _append(self, line: str):
+        self._block.append(line)
+        self._block_len += len(line)
+
+    def _flush(self, blocks: list, final: bool = False):
+        block = "".join(self._block)
+        # Blank lines alone are not a block: they lead into the next one
+        if not block or (not block.strip() and not final):
+            return
+        blocks.append(block)
+        self._block = []
+        self._block_len = 0
+
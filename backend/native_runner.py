@@ -0,0 +1,293 @@
+import hashlib
+import os
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+from backend.limited_process import SANDBOX_CREDENTIALS, limited_command, run_with_limits
+
+SANDBOX_CACHE_DIR = os.getenv("SANDBOX_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gyaansetu-sandbox"))
+NATIVE_CACHE_DIR = os.path.join(SANDBOX_CACHE_DIR, "native")
+NATIVE_COMPILE_TIMEOUT = int(os.getenv("SANDBOX_NATIVE_COMPILE_TIMEOUT", 20))
+NATIVE_COMPILE_MEMORY_MB = int(os.getenv("SANDBOX_NATIVE_COMPILE_MEMORY_MB", 1024))
+
+# Directives that pull other files into the program. Only plain relative names
+# (system headers) may be included; "/etc/passwd", "../../.env" and computed
+# (macro) operands are rejected before the compiler sees them.
+_FILE_DIRECTIVE = re.compile(
+    r"^[ \t]*(?:#|%:|\?\?=)[ \t]*(?:include|include_next|import|embed)\b[ \t]*(.*)"
+    r"|__has_(?:include|include_next|embed)[ \t]*\([ \t]*([^)]*)"
+    r"|\.incbin\b",
+    re.MULTILINE,
+)
+_PLAIN_OPERAND = re.compile(r'^(?:<([^<>"]+)>|"([^<>"]+)")')
+
+# language -> compiler command and flags; the flags are part of the cache key
+TOOLCHAINS = {
+    "c": {
+        "compiler": os.getenv("SANDBOX_CC", "gcc"),
+        "flags": ["-O2", "-std=c17", "-pipe", "-x", "c"],
+        "libs": ["-lm"],
+    },
+    "cpp": {
+        "compiler": os.getenv("SANDBOX_CXX", "g++"),
+        "flags": ["-O2", "-std=c++17", "-pipe", "-x", "c++"],
+        "libs": [],
+    },
+}
+LANGUAGE_ALIASES = {"c++": "cpp", "cxx": "cpp"}
+
+
+def native_language(language: str):
+    """'c' or 'cpp' for languages we compile natively, else None"""
+    language = language.lower()
+    language = LANGUAGE_ALIASES.get(language, language)
+    return language if language in TOOLCHAINS else None
+
+
+def unsafe_include(source: str):
+    """The first directive in `source` that names a file outside the compiler's include path, else None"""
+    # Line splices and block comments may hide a directive from a line-based scan
+    text = re.sub(r"/\*.*?\*/", " ", source.replace("\\\n", ""), flags=re.DOTALL)
+    for match in _FILE_DIRECTIVE.finditer(text):
+        operand = match.group(1) if match.group(1) is not None else match.group(2)
+        plain = _PLAIN_OPERAND.match(operand.strip()) if operand is not None else None
+        name = plain and (plain.group(1) or plain.group(2))
+        if not name or name.startswith(("/", "\\")) or ".." in re.split(r"[/\\]", name):
+            return match.group(0).strip()
+    return None
+
+
+def _disk_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.unlink(path)
+
+
+class BinaryCache:
+    """Compiled programs on disk, keyed by content hash, evicted LRU by total bytes.
+
+    Entries live in one directory: `<key>` for a binary (or a directory of
+    compiled classes) and `<key>.err` for cached compiler diagnostics. Recency
+    lives in memory and is seeded from mtimes, so a restart keeps the warm set.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None  # name -> bytes, least recently used first
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".tmp"):
+                found.append((entry.stat().st_mtime, entry.name, _disk_size(entry.path)))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(found))
+        self.size = sum(self._entries.values())
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, name: str, count: bool = True):
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                self.misses += count
+                return None
+            self._entries.move_to_end(name)
+            self.hits += count
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def staging_path(self, name: str) -> str:
+        with self._lock:
+            self._load()
+        return self.path(f"{name}.{uuid.uuid4().hex}.tmp")
+
+    def put(self, name: str, staged: str) -> str:
+        """Publish a file or directory written at `staged` under `name`"""
+        path = self.path(name)
+        try:
+            os.replace(staged, path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+            # Someone else published the same directory first
+            shutil.rmtree(staged, ignore_errors=True)
+        size = _disk_size(path)
+        with self._lock:
+            self._load()
+            self.size += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                old, old_size = self._entries.popitem(last=False)
+                self.size -= old_size
+                self.evictions += 1
+                try:
+                    # Unlinking a binary that is still running is safe on POSIX
+                    _remove(self.path(old))
+                except OSError:
+                    pass
+        return path
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries or ()),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class NativeRunner:
+    """C and C++ submissions: compile once per (source, toolchain), run the cached binary"""
+
+    def __init__(self, cache: BinaryCache):
+        self.cache = cache
+        self._compile_locks = {}
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def available(language: str) -> bool:
+        language = native_language(language)
+        return bool(language and shutil.which(TOOLCHAINS[language]["compiler"]))
+
+    @staticmethod
+    def _key(language: str, source: str) -> str:
+        toolchain = TOOLCHAINS[language]
+        digest = hashlib.sha256()
+        for part in (language, toolchain["compiler"], " ".join(toolchain["flags"] + toolchain["libs"]), source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._compile_locks.setdefault(key, threading.Lock())
+
+    def compile(self, source: str, language: str):
+        """(binary path, None) or (None, compiler diagnostics)"""
+        language = native_language(language)
+        directive = unsafe_include(source)
+        if directive:
+            # Checked before the cache, which may hold diagnostics from before this check
+            return None, f"Only standard headers may be included: {directive}"
+        key = self._key(language, source)
+        # Identical submissions arriving together compile once
+        lock = self._lock_for(key)
+        with lock:
+            try:
+                binary = self.cache.get(key)
+                if binary:
+                    return binary, None
+                errors = self.cache.get(f"{key}.err", count=False)
+                if errors:
+                    with open(errors, errors="replace") as f:
+                        return None, f.read()
+                return self._compile(key, source, language)
+            finally:
+                with self._locks_guard:
+                    self._compile_locks.pop(key, None)
+
+    def _compile(self, key: str, source: str, language: str):
+        toolchain = TOOLCHAINS[language]
+        # The compiler reads whatever the source names, so it runs like the program
+        # will: as the sandbox user, writing only into a directory handed to it
+        workdir = self.cache.staging_path(key)
+        os.makedirs(workdir)
+        if SANDBOX_CREDENTIALS:
+            # Others may enter the cache but not list it, so in-flight staging names stay private
+            os.chmod(os.path.dirname(workdir), 0o711)
+            os.chown(workdir, SANDBOX_CREDENTIALS["user"], SANDBOX_CREDENTIALS["group"])
+        output = os.path.join(workdir, "a.out")
+        cmd = limited_command(
+            [toolchain["compiler"], *toolchain["flags"], "-", "-o", output, *toolchain["libs"]],
+            cpu_seconds=NATIVE_COMPILE_TIMEOUT, memory_mb=NATIVE_COMPILE_MEMORY_MB, no_writes=False,
+        )
+        try:
+            result = run_with_limits(cmd, source, NATIVE_COMPILE_TIMEOUT, isolated=True)
+            if result["timed_out"] or result["exit_code"] == -signal.SIGXCPU:
+                return None, f"Compilation timed out after {NATIVE_COMPILE_TIMEOUT} seconds"
+            if result["exit_code"] != 0 or not os.path.isfile(output):
+                return None, self._compile_failed(key, result["error"].replace(output, "a.out"))
+            staged = self.cache.staging_path(key)
+            os.replace(output, staged)
+            # Back to the server's user, so sandboxed code cannot rewrite cached binaries
+            os.chown(staged, os.geteuid(), os.getegid())
+            os.chmod(staged, 0o755)
+            return self.cache.put(key, staged), None
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _compile_failed(self, key: str, diagnostics: str) -> str:
+        """Cache compiler diagnostics, so resubmitting the same broken code does not recompile it"""
+        error_file = self.cache.staging_path(f"{key}.err")
+        with open(error_file, "w") as f:
+            f.write(diagnostics)
+        self.cache.put(f"{key}.err", error_file)
+        return diagnostics
+
+    def run(self, source: str, language: str, inputs: list, timeout: int = 5) -> list:
+        """[{output, error, exit_code, execution_time, cpu_time, max_rss, output_truncated}] for each stdin in `inputs`"""
+        binary, error = self.compile(source, language)
+        if error is not None:
+            return [{"output": "", "error": f"Compilation error: {error}", "exit_code": 1, "execution_time": 0}
+                    for _ in inputs]
+        return [self._run_binary(binary, stdin_text, timeout) for stdin_text in inputs]
+
+    @staticmethod
+    def _run_binary(binary: str, stdin_text: str, timeout: int) -> dict:
+        # Compiled code gets past any source-level checks: run it as the sandbox user, in an
+        # empty directory, with none of the server's environment
+        run = run_with_limits(limited_command([binary], cpu_seconds=timeout), stdin_text, timeout, isolated=True)
+        exit_code = run["exit_code"]
+        notes = []
+        if run["timed_out"]:
+            exit_code = -1
+            notes.append(f"Code execution timed out after {timeout} seconds")
+        elif exit_code == -signal.SIGXCPU:
+            notes.append(f"CPU time limit exceeded ({timeout} seconds)")
+        elif run["output_truncated"]:
+            notes.append("Output limit exceeded; output truncated")
+        elif exit_code is not None and exit_code < 0:
+            notes.append(f"Terminated by signal {signal.Signals(-exit_code).name}")
+        error = "\n".join(part for part in [run["error"].rstrip("\n")] + notes if part)
+        return {
+            "output": run["output"],
+            "error": error,
+            "exit_code": exit_code,
+            "execution_time": run["execution_time"],
+            "cpu_time": run["cpu_time"],
+            "max_rss": run["max_rss"],
+            "output_truncated": run["output_truncated"],
+            "timed_out": run["timed_out"] or exit_code == -signal.SIGXCPU,
+        }
+
+    def stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,389 @@
+import hashlib
+import io
+import os
+import re
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import (
+    HRFlowable, PageBreak, Paragraph, Preformatted, SimpleDocTemplate, Spacer, Table, TableStyle
+)
+from pypdf import PdfReader, PdfWriter
+
+from backend.lesson_cache import LRUBytesCache
+
+# Built once at import; ReportLab only reads styles during layout, so every
+# request (and thread) can share them
+_styles = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_styles['Heading1'],
+    fontSize=24,
+    spaceAfter=30,
+    alignment=TA_CENTER,
+    textColor=colors.darkblue
+)
+
+TOPIC_STYLE = ParagraphStyle(
+    'CustomTopic',
+    parent=_styles['Heading2'],
+    fontSize=18,
+    spaceAfter=20,
+    alignment=TA_CENTER,
+    textColor=colors.darkgreen
+)
+
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_styles['Heading2'],
+    fontSize=16,
+    spaceAfter=12,
+    spaceBefore=20,
+    textColor=colors.darkblue
+)
+
+SUBHEADING_STYLE = ParagraphStyle(
+    'CustomSubHeading',
+    parent=_styles['Heading3'],
+    fontSize=14,
+    spaceAfter=8,
+    spaceBefore=12,
+    textColor=colors.darkblue
+)
+
+BODY_STYLE = ParagraphStyle(
+    'CustomBody',
+    parent=_styles['Normal'],
+    fontSize=11,
+    spaceAfter=6,
+    alignment=TA_JUSTIFY,
+    leading=14
+)
+
+CODE_STYLE = ParagraphStyle(
+    'CustomCode',
+    parent=_styles['Code'],
+    fontSize=9,
+    spaceAfter=6,
+    spaceBefore=6,
+    leftIndent=20,
+    rightIndent=20,
+    backColor=colors.lightgrey
+)
+
+LIST_STYLE = ParagraphStyle(
+    'CustomList',
+    parent=BODY_STYLE,
+    alignment=TA_LEFT,
+    leftIndent=18,
+    bulletIndent=6,
+    spaceAfter=3
+)
+
+QUOTE_STYLE = ParagraphStyle(
+    'CustomQuote',
+    parent=BODY_STYLE,
+    leftIndent=20,
+    textColor=colors.darkslategray,
+    fontName='Helvetica-Oblique'
+)
+
+TABLE_HEADER_STYLE = ParagraphStyle(
+    'CustomTableHeader',
+    parent=BODY_STYLE,
+    alignment=TA_LEFT,
+    fontName='Helvetica-Bold',
+    fontSize=10,
+    leading=12,
+    spaceAfter=0
+)
+
+TABLE_CELL_STYLE = ParagraphStyle(
+    'CustomTableCell',
+    parent=TABLE_HEADER_STYLE,
+    fontName='Helvetica'
+)
+
+FOOTER_STYLE = ParagraphStyle(
+    'Footer',
+    parent=_styles['Normal'],
+    fontSize=10,
+    alignment=TA_CENTER,
+    textColor=colors.grey
+)
+
+PAGE_MARGIN = 72
+TEXT_WIDTH = A4[0] - 2 * PAGE_MARGIN
+
+# Rendered notes kept in memory, keyed by content hash
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+pdf_cache = LRUBytesCache(PDF_CACHE_MAX_BYTES)
+
+
+# Block-level markdown, matched against one line at a time
+FENCE_RE = re.compile(r'^\s*(```|~~~)')
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+BULLET_RE = re.compile(r'^\s*[-*+•]\s+(.*)$')
+NUMBERED_RE = re.compile(r'^\s*(\d+)[.)]\s+(.*)$')
+QUOTE_RE = re.compile(r'^\s*>\s?(.*)$')
+RULE_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+TABLE_RE = re.compile(r'^\s*\|(.*)\|\s*$')
+TABLE_SEPARATOR_RE = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+# Inline markdown; alternatives are tried left to right at each position
+INLINE_RE = re.compile(
+    r'`([^`]+)`'                         # code span
+    r'|\*\*(.+?)\*\*|__(.+?)__'          # bold
+    r'|\*(?=\S)(.+?)(?<=\S)\*'           # italic
+    r'|\[([^\]]+)\]\(([^)\s]+)\)'        # link
+)
+
+
+def inline_markup(text: str) -> str:
+    """Markdown inline formatting as ReportLab paragraph markup, with the text escaped"""
+    out = []
+    pos = 0
+    for m in INLINE_RE.finditer(text):
+        out.append(escape(text[pos:m.start()]))
+        code, bold, bold2, italic, label, url = m.groups()
+        if code is not None:
+            out.append(f"<font name='Courier'>{escape(code)}</font>")
+        elif bold is not None or bold2 is not None:
+            out.append(f"<b>{inline_markup(bold if bold is not None else bold2)}</b>")
+        elif italic is not None:
+            out.append(f"<i>{inline_markup(italic)}</i>")
+        else:
+            out.append(f'<link href="{escape(url, {chr(34): "&quot;"})}" color="blue">{inline_markup(label)}</link>')
+        pos = m.end()
+    out.append(escape(text[pos:]))
+    return "".join(out)
+
+
+def _table_row(line: str) -> list:
+    return [cell.strip() for cell in TABLE_RE.match(line).group(1).split("|")]
+
+
+def _table_cell(text: str, style: ParagraphStyle, width: float):
+    # Plain text that fits on one line is drawn as a string: no paragraph parse or wrap
+    if not INLINE_RE.search(text) and stringWidth(text, style.fontName, style.fontSize) <= width - 12:
+        return text
+    return Paragraph(inline_markup(text), style)
+
+
+def _table(rows: list) -> Table:
+    width = max(len(row) for row in rows)
+    column = TEXT_WIDTH / width
+    cells = [
+        [_table_cell(cell, TABLE_HEADER_STYLE if r == 0 else TABLE_CELL_STYLE, column) for cell in row]
+        + [""] * (width - len(row))
+        for r, row in enumerate(rows)
+    ]
+    table = Table(cells, colWidths=[column] * width, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('FONT', (0, 0), (-1, 0), TABLE_HEADER_STYLE.fontName, TABLE_HEADER_STYLE.fontSize),
+        ('FONT', (0, 1), (-1, -1), TABLE_CELL_STYLE.fontName, TABLE_CELL_STYLE.fontSize),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    return table
+
+
+def markdown_flowables(text: str) -> list:
+    """Lesson markdown as ReportLab flowables, in one pass over its lines.
+
+    Headings, bullet and numbered lists, block quotes, rules, fenced code
+    (Preformatted, kept verbatim) and pipe tables are recognised; consecutive
+    text lines form one paragraph. All text is escaped before it reaches
+    ReportLab's paragraph parser.
+    """
+    story = []
+    paragraph = []  # pending lines of the current paragraph
+    code = None  # lines of an open code fence
+    table = []  # rows of the current table
+
+    def flush():
+        if paragraph:
+            story.append(Paragraph(inline_markup(" ".join(paragraph)), BODY_STYLE))
+            paragraph.clear()
+        if table:
+            if len(table) > 1 and TABLE_SEPARATOR_RE.match("|".join(table[1])):
+                del table[1]
+            story.append(_table(table))
+            table.clear()
+
+    for line in text.splitlines():
+        if code is not None:
+            if FENCE_RE.match(line):
+                story.append(Preformatted("\n".join(code), CODE_STYLE))
+                code = None
+            else:
+                code.append(line.rstrip())
+            continue
+
+        if FENCE_RE.match(line):
+            flush()
+            code = []
+            continue
+        m = TABLE_RE.match(line)
+        if m:
+            if paragraph:
+                flush()
+            table.append(_table_row(line))
+            continue
+        if table:
+            flush()
+        if not line.strip():
+            flush()
+            continue
+
+        m = HEADING_RE.match(line)
+        if m:
+            flush()
+            style = HEADING_STYLE if len(m.group(1)) <= 2 else SUBHEADING_STYLE
+            story.append(Paragraph(inline_markup(m.group(2)), style))
+            continue
+        if RULE_RE.match(line):
+            flush()
+            story.append(HRFlowable(width="100%", thickness=0.5, color=colors.grey, spaceBefore=6, spaceAfter=6))
+            continue
+        m = BULLET_RE.match(line)
+        if m:
+            flush()
+            story.append(Paragraph(inline_markup(m.group(1)), LIST_STYLE, bulletText="•"))
+            continue
+        m = NUMBERED_RE.match(line)
+        if m:
+            flush()
+            story.append(Paragraph(inline_markup(m.group(2)), LIST_STYLE, bulletText=f"{m.group(1)}."))
+            continue
+        m = QUOTE_RE.match(line)
+        if m:
+            flush()
+            story.append(Paragraph(inline_markup(m.group(1)), QUOTE_STYLE))
+            continue
+        paragraph.append(line.strip())
+
+    if code is not None:
+        # Unclosed fence: keep what was written
+        story.append(Preformatted("\n".join(code), CODE_STYLE))
+    flush()
+    return story
+
+
+def lesson_story(lesson_content, topic, lesson_title):
+    """Flowables for one lesson: the notes header followed by its content"""
+    return [
+        Paragraph("GyaanSetu AI - Learning Notes", TITLE_STYLE),
+        Spacer(1, 12),
+        Paragraph(f"Course: {escape(topic)}", TOPIC_STYLE),
+        Spacer(1, 12),
+        Paragraph(f"Lesson: {escape(lesson_title)}", HEADING_STYLE),
+        Spacer(1, 20),
+        *markdown_flowables(lesson_content),
+    ]
+
+
+def footer_story():
+    return [PageBreak(), Paragraph("Generated by GyaanSetu AI", FOOTER_STYLE)]
+
+
+def render_pdf(story) -> bytes:
+    """Lay out `story` on A4 pages into an in-memory PDF"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            rightMargin=PAGE_MARGIN, leftMargin=PAGE_MARGIN,
+                            topMargin=PAGE_MARGIN, bottomMargin=18)
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def create_pdf(lesson_content, topic, lesson_title) -> bytes:
+    """Create a PDF from lesson content"""
+    return render_pdf(lesson_story(lesson_content, topic, lesson_title) + footer_story())
+
+
+def pdf_cache_key(lesson_content, topic, lesson_title) -> str:
+    digest = hashlib.sha256()
+    for part in (lesson_content, topic, lesson_title):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def notes_pdf(lesson_content, topic, lesson_title) -> bytes:
+    """The notes PDF for a lesson, laid out once per distinct content"""
+    key = pdf_cache_key(lesson_content, topic, lesson_title)
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        pdf = create_pdf(lesson_content, topic, lesson_title)
+        pdf_cache.put(key, pdf)
+    return pdf
+
+
+# ---------- whole-course export ----------
+# These run in worker processes (see course_export.py), so they take and
+# return plain strings and bytes.
+
+def lesson_section_pdf(lesson_content, topic, lesson_title) -> bytes:
+    """One lesson laid out as its own PDF, to be merged into a course document"""
+    return render_pdf(lesson_story(lesson_content, topic, lesson_title))
+
+
+def contents_story(topic, entries):
+    """Cover and table of contents for [(lesson title, first page), ...]"""
+    story = [
+        Paragraph("GyaanSetu AI - Course Notes", TITLE_STYLE),
+        Spacer(1, 12),
+        Paragraph(f"Course: {escape(topic)}", TOPIC_STYLE),
+        Spacer(1, 20),
+        Paragraph("Contents", HEADING_STYLE),
+    ]
+    rows = [
+        [Paragraph(f"{number}. {escape(title)}", BODY_STYLE), str(page)]
+        for number, (title, page) in enumerate(entries, start=1)
+    ]
+    if rows:
+        table = Table(rows, colWidths=[380, 70])
+        table.setStyle(TableStyle([
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        story.append(table)
+    story.append(Spacer(1, 30))
+    story.append(Paragraph("Generated by GyaanSetu AI", FOOTER_STYLE))
+    return story
+
+
+def course_pdf(topic, titles, sections) -> bytes:
+    """Merge per-lesson PDFs behind a table of contents, with one bookmark per lesson"""
+    readers = [PdfReader(io.BytesIO(section)) for section in sections]
+    page_counts = [len(reader.pages) for reader in readers]
+
+    # Page numbers in the contents depend on how long the contents are
+    contents_pages = 1
+    while True:
+        entries, page = [], contents_pages + 1
+        for title, count in zip(titles, page_counts):
+            entries.append((title, page))
+            page += count
+        contents = PdfReader(io.BytesIO(render_pdf(contents_story(topic, entries))))
+        if len(contents.pages) == contents_pages:
+            break
+        contents_pages = len(contents.pages)
+
+    writer = PdfWriter()
+    for page in contents.pages:
+        writer.add_page(page)
+    for title, reader in zip(titles, readers):
+        first_page = len(writer.pages)
+        for page in reader.pages:
+            writer.add_page(page)
+        writer.add_outline_item(title, first_page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
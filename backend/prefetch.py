@@ -0,0 +1,97 @@
+import asyncio
+from collections import OrderedDict
+
+
+class PrefetchScheduler:
+    """Background scheduler for speculative lesson generation.
+
+    Jobs are (thread_id, topic, lesson index, title). A fixed number of worker
+    tasks drain a bounded FIFO, so at most `workers` speculative generations run
+    at once across the whole process; demand requests never queue behind them.
+    A thread only ever has one speculative target: scheduling a new lesson for
+    a thread drops its older jobs, and `cancel_thread` drops everything when the
+    student leaves the course.
+    """
+
+    def __init__(self, fetch, workers: int = 4, max_pending: int = 200):
+        self._fetch = fetch
+        self._workers = workers
+        self._max_pending = max_pending
+        self._pending = OrderedDict()  # key -> job
+        self._running = {}  # key -> (job, task)
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = []
+        self.scheduled = 0
+        self.dropped = 0
+        self.cancelled = 0
+
+    @staticmethod
+    def _key(topic: str, index: int, title: str):
+        return (topic, index, title)
+
+    def _ensure_workers(self):
+        # Workers are started lazily, from inside the running event loop
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self._workers)]
+
+    def schedule(self, thread_id: str, topic: str, index: int, title: str):
+        key = self._key(topic, index, title)
+        self._drop_thread(thread_id, keep=key)
+        job = self._pending.get(key) or self._running.get(key, (None, None))[0]
+        if job is not None:
+            job["threads"].add(thread_id)
+            return
+        if len(self._pending) >= self._max_pending:
+            # Oldest speculation is the least likely to still be useful
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._pending[key] = {"threads": {thread_id}, "args": (topic, index, title)}
+        self.scheduled += 1
+        self._ensure_workers()
+        self._wakeup.set()
+
+    def cancel_thread(self, thread_id: str):
+        self._drop_thread(thread_id)
+
+    def _drop_thread(self, thread_id: str, keep=None):
+        for key, job in list(self._pending.items()):
+            if key != keep and thread_id in job["threads"]:
+                job["threads"].discard(thread_id)
+                if not job["threads"]:
+                    del self._pending[key]
+                    self.cancelled += 1
+        for key, (job, task) in list(self._running.items()):
+            if key != keep and thread_id in job["threads"]:
+                job["threads"].discard(thread_id)
+                # Only stop work no other student is waiting on
+                if not job["threads"]:
+                    task.cancel()
+                    self.cancelled += 1
+
+    async def _next_job(self):
+        while not self._pending:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return self._pending.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            key, job = await self._next_job()
+            task = asyncio.ensure_future(self._fetch(*job["args"]))
+            self._running[key] = (job, task)
+            try:
+                # asyncio.wait does not raise if the job itself is cancelled
+                await asyncio.wait([task])
+                if not task.cancelled() and task.exception() is not None:
+                    print(f"Prefetch error for {key}: {task.exception()}")
+            finally:
+                self._running.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "running": len(self._running),
+            "scheduled": self.scheduled,
+            "dropped": self.dropped,
+            "cancelled": self.cancelled,
+        }
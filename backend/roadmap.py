@@ -6,27 +6,13 @@ import os
 import json
 import re
 from typing import TypedDict
-from langgraph.checkpoint.mongodb import MongoDBSaver
-from pymongo import MongoClient
-import google.generativeai as genai
+from backend import db
+from backend.core import gemini_generate, MODEL_NAME
+from backend.lesson_cache import prompt_cache_key
+from backend.roadmap_cache import RoadmapCache
 
 load_dotenv()
 
-client = MongoClient(os.getenv("MONGO_CLIENT"))
-
-saver = MongoDBSaver.from_conn_string(
-    os.getenv("MONGO_CLIENT"),
-    db_name="chatbot_langgraph",
-    collection_name="chatbot_sessions"
-)
-
-genai.configure(api_key=os.getenv("GENAI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-def ask_gemini(prompt: str):
-    response = model.generate_content(prompt)
-    return response.text.strip()
-
 # llm = HuggingFaceEndpoint(
 #     repo_id="Qwen/Qwen3-Coder-480B-A35B-Instruct",
 #     task="text-generation"
@@ -80,11 +66,11 @@ def safe_json_parse(text: str):
             pass
     return None
 
-def generate_roadmap(state: agentstate) -> agentstate:
+async def generate_roadmap(state: agentstate) -> agentstate:
     prompt_text = prompt.format(skill=state['skill'])
-    response = model.generate_content(prompt_text)
+    response_text = await gemini_generate(prompt_text)
     try:
-        roadmap_json = safe_json_parse(response.text.strip())
+        roadmap_json = safe_json_parse(response_text)
     except:
         roadmap_json = {"error": "Failed to parse roadmap."}
     state['roadmap'] = roadmap_json
@@ -96,4 +82,22 @@ graph.add_node("generate_roadmap", generate_roadmap)
 graph.add_edge(START, "generate_roadmap")
 graph.add_edge("generate_roadmap", END)
 
-roadmap_workflow = graph.compile(checkpointer=saver)
\ No newline at end of file
+# No checkpointer: a roadmap run has no session to resume, and results are kept in roadmap_cache
+roadmap_workflow = graph.compile()
+
+
+async def run_roadmap_workflow(skill: str):
+    result = await roadmap_workflow.ainvoke({"skill": skill})
+    return result["roadmap"]
+
+
+# Students ask for the same few dozen skills over and over; the prompt template
+# and model are part of the key, so editing either regenerates every roadmap
+roadmap_cache = RoadmapCache(
+    db.roadmap_cache,
+    run_roadmap_workflow,
+    version=prompt_cache_key(prompt.template, MODEL_NAME)[:16],
+    max_bytes=int(os.getenv("ROADMAP_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+    fresh_seconds=int(os.getenv("ROADMAP_CACHE_FRESH_SECONDS", 7 * 24 * 3600)),
+    ttl_seconds=int(os.getenv("ROADMAP_CACHE_TTL_SECONDS", 30 * 24 * 3600)),
+)
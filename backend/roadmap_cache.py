@@ -0,0 +1,201 @@
+import asyncio
+import json
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta
+
+from backend.lesson_cache import LRUTextCache
+from backend.singleflight import SingleFlight
+
+# Spellings students actually type -> the skill name roadmaps are generated for
+SKILL_ALIASES = {
+    "py": "python",
+    "python3": "python",
+    "python 3": "python",
+    "js": "javascript",
+    "java script": "javascript",
+    "ts": "typescript",
+    "node": "node.js",
+    "nodejs": "node.js",
+    "node js": "node.js",
+    "react js": "react",
+    "reactjs": "react",
+    "react.js": "react",
+    "cpp": "c++",
+    "cplusplus": "c++",
+    "c plus plus": "c++",
+    "golang": "go",
+    "ml": "machine learning",
+    "dl": "deep learning",
+    "ai": "artificial intelligence",
+    "dsa": "data structures and algorithms",
+    "data structures & algorithms": "data structures and algorithms",
+    "data structures and algorithm": "data structures and algorithms",
+    "web dev": "web development",
+    "webdev": "web development",
+    "web developer": "web development",
+    "frontend": "frontend development",
+    "front end": "frontend development",
+    "front end development": "frontend development",
+    "backend": "backend development",
+    "back end": "backend development",
+    "back end development": "backend development",
+    "full stack": "full stack development",
+    "fullstack": "full stack development",
+    "full stack web development": "full stack development",
+    "devops engineering": "devops",
+    "dev ops": "devops",
+    "sql database": "sql",
+    "k8s": "kubernetes",
+}
+
+SEPARATORS = re.compile(r"[\s_\-]+")
+# Trailing noise such as "Python roadmap" or "learn react."
+FILLER = re.compile(r"^(?:learn(?:ing)?|how to learn)\s+|\s+(?:roadmap|road map|course|tutorial)$")
+
+
+def canonical_skill(skill: str) -> str:
+    """Cache key for a skill name: case, spacing, punctuation and common aliases folded.
+
+    "Python ", "python3" and "PY" all become "python"; "Web-Dev" becomes
+    "web development". Characters that carry meaning ("c++", "c#", "node.js")
+    are kept.
+    """
+    skill = unicodedata.normalize("NFKC", skill).casefold()
+    skill = SEPARATORS.sub(" ", skill).strip(" .,;:!?'\"`")
+    skill = FILLER.sub("", skill).strip()
+    return SKILL_ALIASES.get(skill, skill)
+
+
+def is_valid_roadmap(roadmap) -> bool:
+    """Only real roadmaps are cached; parse failures and errors are retried next time"""
+    return isinstance(roadmap, dict) and bool(roadmap) and "error" not in roadmap
+
+
+class RoadmapCache:
+    """Roadmaps by canonical skill: in-process LRU in front of a MongoDB collection.
+
+    `generate(skill)` produces a roadmap on a miss; concurrent misses for the
+    same skill share one call. Entries older than `fresh_seconds` are still
+    served, and regenerated in the background. MongoDB removes documents at
+    `expires_at` (TTL index), `ttl_seconds` after their last refresh.
+    `version` identifies the prompt and model, so changing either stops serving
+    old roadmaps. MongoDB failures are logged and treated as misses.
+    """
+
+    def __init__(self, collection, generate, version: str = "", max_bytes: int = 8 * 1024 * 1024,
+                 fresh_seconds: int = 7 * 24 * 3600, ttl_seconds: int = 30 * 24 * 3600):
+        self.collection = collection
+        self._generate = generate
+        self.version = version
+        self.memory = LRUTextCache(max_bytes)
+        self.fresh_seconds = fresh_seconds
+        self.ttl_seconds = ttl_seconds
+        self._inflight = SingleFlight()
+        self._refreshing = set()
+        self._tasks = set()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def key(self, skill: str) -> str:
+        return f"{self.version}:{skill}" if self.version else skill
+
+    async def get(self, skill: str):
+        """Roadmap for `skill`, from cache when possible; None or an error dict if generation failed.
+        Raises ValueError for a skill name with nothing left after normalization."""
+        skill = canonical_skill(skill)
+        if not skill:
+            raise ValueError("Skill name is required")
+        key = self.key(skill)
+
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory_hits += 1
+        else:
+            entry = await asyncio.to_thread(self._load, key)
+            if entry is not None:
+                self.db_hits += 1
+                self.memory.put(key, entry)
+        if entry is not None:
+            cached = json.loads(entry)
+            age = time.time() - cached["refreshed_at"]
+            if age < self.ttl_seconds:
+                if age >= self.fresh_seconds:
+                    self._refresh_later(key, skill)
+                return cached["roadmap"]
+
+        self.misses += 1
+        return await self._inflight.do(key, lambda: self._fill(key, skill))
+
+    def _load(self, key: str):
+        try:
+            doc = self.collection.find_one({"_id": key}, {"roadmap": 1, "refreshed_at": 1})
+        except Exception as e:
+            print(f"Roadmap cache read error: {e}")
+            return None
+        if not doc:
+            return None
+        return json.dumps({"roadmap": doc["roadmap"], "refreshed_at": doc["refreshed_at"].timestamp()})
+
+    def _save(self, key: str, skill: str, roadmap: dict, refreshed_at: datetime):
+        try:
+            self.collection.update_one(
+                {"_id": key},
+                {
+                    "$set": {
+                        "skill": skill,
+                        "roadmap": roadmap,
+                        "refreshed_at": refreshed_at,
+                        "expires_at": refreshed_at + timedelta(seconds=self.ttl_seconds),
+                    },
+                    "$setOnInsert": {"created_at": refreshed_at},
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Roadmap cache write error: {e}")
+
+    async def _fill(self, key: str, skill: str):
+        roadmap = await self._generate(skill)
+        if not is_valid_roadmap(roadmap):
+            self.failures += 1
+            return roadmap
+        refreshed_at = datetime.now()
+        self.memory.put(key, json.dumps({"roadmap": roadmap, "refreshed_at": refreshed_at.timestamp()}))
+        await asyncio.to_thread(self._save, key, skill, roadmap, refreshed_at)
+        return roadmap
+
+    def _refresh_later(self, key: str, skill: str):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        self.refreshes += 1
+        task = asyncio.ensure_future(self._refresh(key, skill))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: str, skill: str):
+        # A failed refresh keeps serving the stale roadmap until it expires
+        try:
+            await self._inflight.do(key, lambda: self._fill(key, skill))
+        except Exception as e:
+            print(f"Roadmap refresh error for {skill}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.memory),
+            "bytes": self.memory.size,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshing),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "coalesced": self._inflight.coalesced,
+        }
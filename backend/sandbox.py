@@ -0,0 +1,313 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from backend.java_runner import JAVA_CLASS_CACHE_DIR, JAVA_HEAP_MB, JavaRunner, java_class_name
+from backend.limited_process import limited_command, run_with_limits
+from backend.native_runner import NATIVE_CACHE_DIR, BinaryCache, NativeRunner, native_language
+from backend.warm_pool import python_pool, run_python_once
+
+# Block dangerous operations
+DANGEROUS_PATTERNS = [
+    "import os", "import sys", "import subprocess", "import shutil",
+    "open(", "file(", "__import__", "eval(", "exec(",
+    "os.system", "os.popen", "subprocess.", "shutil.",
+    "rm -rf", "del /", "format c:", "mkfs"
+]
+
+
+def find_security_violation(code: str) -> Optional[str]:
+    """The first blocked pattern found in `code`, if any"""
+    code_lower = code.lower()
+    for pattern in DANGEROUS_PATTERNS:
+        if pattern in code_lower:
+            return pattern
+    return None
+
+
+def get_file_extension(language: str) -> str:
+    """Get file extension for the given language"""
+    extensions = {
+        "python": ".py",
+        "javascript": ".js",
+        "java": ".java",
+        "cpp": ".cpp",
+        "c++": ".cpp",
+        "c": ".c"
+    }
+    return extensions.get(language.lower(), ".py")
+
+
+# Warm Python interpreters for /execute-code and grading; see warm_pool.py
+USE_WARM_POOL = os.getenv("SANDBOX_WARM_POOL", "1") == "1"
+python_workers = python_pool(
+    size=int(os.getenv("SANDBOX_PYTHON_WORKERS", 4)),
+    max_runs=int(os.getenv("SANDBOX_MAX_RUNS_PER_WORKER", 50)),
+)
+# Warm JVM hosts plus a compiled-class cache; see java_runner.py
+java_runner = JavaRunner(
+    BinaryCache(JAVA_CLASS_CACHE_DIR, max_bytes=int(os.getenv("SANDBOX_CLASS_CACHE_MAX_BYTES", 128 * 1024 * 1024))),
+    size=int(os.getenv("SANDBOX_JAVA_HOSTS", 2)),
+    max_runs=int(os.getenv("SANDBOX_JAVA_MAX_RUNS", 200)),
+)
+
+# C/C++: binaries cached by (source, toolchain) hash; see native_runner.py
+native_runner = NativeRunner(BinaryCache(
+    NATIVE_CACHE_DIR, max_bytes=int(os.getenv("SANDBOX_BINARY_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+))
+
+
+def _usage(run: dict) -> dict:
+    """Measured resource use of one run: CPU seconds, peak RSS in KB, whether output was cut off"""
+    return {
+        "cpu_time": run.get("cpu_time"),
+        "max_rss": run.get("max_rss"),
+        "output_truncated": run.get("output_truncated", False),
+    }
+
+
+def _pooled_result(run: dict, timeout: int) -> dict:
+    """A warm-worker result in the /execute-code response shape"""
+    if run.get("timed_out"):
+        return {"success": False, "output": "", "error": f"Code execution timed out after {timeout} seconds",
+                "execution_time": timeout, **_usage(run)}
+    if run["exit_code"] == -1:
+        return {"success": False, "output": "", "error": run["error"], "execution_time": timeout, **_usage(run)}
+    if run["error"].startswith("Compilation error:"):
+        return {"success": False, "output": "", "error": run["error"], "execution_time": 0}
+    return {
+        "success": True,
+        "output": run["output"],
+        "error": run["error"],
+        "return_code": run["exit_code"],
+        "execution_time": run["execution_time"],
+        **_usage(run)
+    }
+
+
+def execute_code_safely(code: str, language: str, input_data: str = None, timeout: int = 5):
+    """Execute code safely with timeout and resource limits"""
+    if USE_WARM_POOL and language.lower() == "python":
+        return _pooled_result(python_workers.run(code, [input_data or ""], timeout)[0], timeout)
+    if USE_WARM_POOL and language.lower() == "java" and java_runner.available():
+        return _pooled_result(java_runner.run(code, [input_data or ""], timeout)[0], timeout)
+    if native_language(language) and NativeRunner.available(language):
+        return _pooled_result(native_runner.run(code, language, [input_data or ""], timeout)[0], timeout)
+    return execute_in_subprocess(code, language, input_data, timeout)
+
+
+def execute_in_subprocess(code: str, language: str, input_data: str = None, timeout: int = 5):
+    """One fresh process per run (the path for languages without a warm pool)"""
+    try:
+        # Create temporary files
+        if language.lower() == "java":
+            # javac requires the file to be named after its public class
+            temp_file = os.path.join(tempfile.mkdtemp(), java_class_name(code) + ".java")
+            with open(temp_file, 'w') as f:
+                f.write(code)
+        else:
+            with tempfile.NamedTemporaryFile(mode='w', suffix=get_file_extension(language), delete=False) as f:
+                f.write(code)
+                temp_file = f.name
+
+        workdir = os.path.dirname(temp_file)
+        try:
+            # Prepare command based on language
+            limits = {}
+            if language.lower() == "python":
+                cmd = [sys.executable, temp_file]
+            elif language.lower() == "javascript":
+                cmd = ["node", temp_file]
+                # V8 reserves far more address space than it uses and starts worker threads
+                limits = {"memory_mb": None, "max_processes": None}
+            elif language.lower() == "java":
+                # Compile first, then run
+                class_name = java_class_name(code)
+                compile_cmd = ["javac", temp_file]
+                compile_result = subprocess.run(compile_cmd, capture_output=True, text=True, timeout=timeout)
+                if compile_result.returncode != 0:
+                    return {
+                        "success": False,
+                        "output": "",
+                        "error": f"Compilation error: {compile_result.stderr}",
+                        "execution_time": 0
+                    }
+                cmd = ["java", f"-Xmx{JAVA_HEAP_MB}m", "-cp", workdir, class_name]
+                # The heap is capped with -Xmx instead; the JVM needs address space and threads
+                limits = {"memory_mb": None, "max_processes": None}
+            else:
+                return {
+                    "success": False,
+                    "output": "",
+                    "error": f"Unsupported language: {language}",
+                    "execution_time": 0
+                }
+
+            # Execute with timeout, rlimits and a cap on captured output
+            run = run_with_limits(limited_command(cmd, cpu_seconds=timeout, **limits), input_data, timeout, cwd=workdir)
+            if run["timed_out"]:
+                return {
+                    "success": False,
+                    "output": "",
+                    "error": f"Code execution timed out after {timeout} seconds",
+                    "execution_time": timeout,
+                    **_usage(run)
+                }
+            error = run["error"]
+            if run["output_truncated"]:
+                error = "\n".join(part for part in [error.rstrip("\n"), "Output limit exceeded; output truncated"] if part)
+            return {
+                "success": True,
+                "output": run["output"],
+                "error": error,
+                "return_code": run["exit_code"],
+                "execution_time": run["execution_time"],
+                **_usage(run)
+            }
+
+        except subprocess.TimeoutExpired:
+            # javac itself ran past the limit
+            return {
+                "success": False,
+                "output": "",
+                "error": f"Code execution timed out after {timeout} seconds",
+                "execution_time": timeout
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "output": "",
+                "error": f"Execution error: {str(e)}",
+                "execution_time": 0
+            }
+        finally:
+            # Clean up
+            if os.path.exists(temp_file):
+                os.unlink(temp_file)
+            if language.lower() == "java":
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    except Exception as e:
+        return {
+            "success": False,
+            "output": "",
+            "error": f"System error: {str(e)}",
+            "execution_time": 0
+        }
+
+
+# ---------- grading ----------
+# Coding quiz answers are graded by running them, not by comparing source text.
+
+# Submissions graded at once across all requests
+grading_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("GRADING_WORKERS", 8)), thread_name_prefix="grader"
+)
+
+
+def run_test_inputs(code: str, language: str, inputs: list, timeout: int = 5) -> list:
+    """[{output, error, exit_code, ...}] for each stdin in `inputs`"""
+    if language.lower() == "python":
+        # One worker request covers every case
+        if USE_WARM_POOL:
+            return python_workers.run(code, inputs, timeout)
+        return run_python_once(code, inputs, timeout)
+    if language.lower() == "java" and java_runner.available():
+        # Compiled once (or cached), then every case runs on one warm JVM
+        return java_runner.run(code, inputs, timeout)
+    if native_language(language) and NativeRunner.available(language):
+        return native_runner.run(code, language, inputs, timeout)
+    # No multi-case harness for this language yet: one launch per case
+    return [
+        {"output": r.get("output", ""), "error": r.get("error", ""),
+         "exit_code": r.get("return_code") if r.get("success") else -1, **_usage(r)}
+        for r in (execute_code_safely(code, language, stdin_text, timeout) for stdin_text in inputs)
+    ]
+
+
+def precompile(code: str, language: str) -> Optional[str]:
+    """Compile once ahead of a batch of runs; compiler diagnostics on failure"""
+    if language.lower() == "java" and java_runner.available():
+        try:
+            return java_runner.compile(code)[2]
+        except Exception as e:
+            return f"Java sandbox error: {e}"
+    if native_language(language) and NativeRunner.available(language):
+        return native_runner.compile(code, language)[1]
+    return None
+
+
+def run_case(code: str, language: str, stdin_text: str, timeout: int = 5) -> dict:
+    """One test input on its own worker, so cases can run side by side"""
+    return run_test_inputs(code, language, [stdin_text], timeout)[0]
+
+
+def normalize_output(text: str) -> str:
+    """Ignore trailing whitespace on lines and leading/trailing blank lines"""
+    return "\n".join(line.rstrip() for line in str(text).strip().splitlines())
+
+
+def _test_cases_for(question: dict) -> list:
+    cases = [
+        {"input": str(case.get("input") or ""), "expected_output": case.get("expected_output")}
+        for case in question.get("test_cases") or []
+        if isinstance(case, dict)
+    ]
+    if not cases:
+        cases = [{"input": "", "expected_output": question.get("expected_output")}]
+    return cases
+
+
+def run_succeeded(run: dict) -> bool:
+    """A run is judged on exit status and stdout; stderr (warnings, debug prints) is reported, not graded.
+    Timeouts, crashes and truncated output all end with a non-zero status."""
+    return run.get("exit_code") == 0 and not run.get("output_truncated")
+
+
+def grade_coding_answer(code, question: dict, timeout: int = 5) -> dict:
+    """Run a coding answer against the question's test cases.
+    Cases without an expected output are checked against the reference
+    solution (the question's correct_answer) run on the same input."""
+    code = str(code or "")
+    language = question.get("language", "python")
+    if not code.strip():
+        return {"is_correct": False, "passed_tests": 0, "total_tests": 0, "test_results": [], "error": "No code submitted"}
+    violation = find_security_violation(code)
+    if violation:
+        return {"is_correct": False, "passed_tests": 0, "total_tests": 0, "test_results": [],
+                "error": f"Security violation: '{violation}' not allowed"}
+
+    cases = _test_cases_for(question)
+    missing = [i for i, case in enumerate(cases) if case["expected_output"] is None]
+    reference = question.get("correct_answer")
+    if missing and isinstance(reference, str) and reference.strip():
+        reference_runs = run_test_inputs(reference, language, [cases[i]["input"] for i in missing], timeout)
+        for i, run in zip(missing, reference_runs):
+            if run_succeeded(run):
+                cases[i]["expected_output"] = run["output"]
+    cases = [case for case in cases if case["expected_output"] is not None]
+    if not cases:
+        return {"is_correct": False, "passed_tests": 0, "total_tests": 0, "test_results": [],
+                "error": "Question has no runnable test cases"}
+
+    runs = run_test_inputs(code, language, [case["input"] for case in cases], timeout)
+    test_results = []
+    for case, run in zip(cases, runs):
+        passed = run_succeeded(run) and normalize_output(run["output"]) == normalize_output(case["expected_output"])
+        test_results.append({"passed": passed, "output": run["output"], "error": run["error"]})
+    passed_tests = sum(r["passed"] for r in test_results)
+    return {
+        "is_correct": passed_tests == len(test_results),
+        "passed_tests": passed_tests,
+        "total_tests": len(test_results),
+        "test_results": test_results,
+    }
+
+
+def grade_coding_answers(jobs: list, timeout: int = 5) -> list:
+    """Grade [(code, question), ...] concurrently; results come back in order"""
+    return list(grading_pool.map(lambda job: grade_coding_answer(job[0], job[1], timeout), jobs))
@@ -0,0 +1,60 @@
+from langgraph.checkpoint.mongodb import MongoDBSaver
+
+# Per-turn inputs and outputs (the query, full lesson / explanation text,
+# performance snapshots) are returned to the caller but never written to the
+# session checkpoint. The lesson body can always be recovered from the lesson cache.
+TRANSIENT_KEYS = ("query", "response", "explanation", "user_performance", "pending_lesson")
+
+
+def _compact(values: dict) -> dict:
+    return {k: v for k, v in values.items() if k not in TRANSIENT_KEYS}
+
+
+class CompactMongoDBSaver(MongoDBSaver):
+    """MongoDBSaver that keeps tutor sessions small.
+
+    Checkpoints only hold navigation state (mode, topic, syllabus, current
+    lesson, ...). Transient keys are stripped from channel values, pending
+    writes and the step metadata before anything reaches MongoDB.
+    """
+
+    def _strip_checkpoint(self, checkpoint, metadata):
+        checkpoint = {**checkpoint, "channel_values": _compact(checkpoint.get("channel_values", {}))}
+        writes = metadata.get("writes") if metadata else None
+        if isinstance(writes, dict):
+            metadata = {
+                **metadata,
+                "writes": {
+                    node: _compact(out) if isinstance(out, dict) else out
+                    for node, out in writes.items()
+                },
+            }
+        return checkpoint, metadata
+
+    def _strip_writes(self, writes):
+        return [(channel, value) for channel, value in writes if channel not in TRANSIENT_KEYS]
+
+    def put(self, config, checkpoint, metadata, *args, **kwargs):
+        checkpoint, metadata = self._strip_checkpoint(checkpoint, metadata)
+        return super().put(config, checkpoint, metadata, *args, **kwargs)
+
+    async def aput(self, config, checkpoint, metadata, *args, **kwargs):
+        checkpoint, metadata = self._strip_checkpoint(checkpoint, metadata)
+        return await super().aput(config, checkpoint, metadata, *args, **kwargs)
+
+    def put_writes(self, config, writes, *args, **kwargs):
+        return super().put_writes(config, self._strip_writes(writes), *args, **kwargs)
+
+    async def aput_writes(self, config, writes, *args, **kwargs):
+        return await super().aput_writes(config, self._strip_writes(writes), *args, **kwargs)
+
+
+def build_session_saver(client, db_name: str, collection_name: str, ttl_seconds=None) -> CompactMongoDBSaver:
+    """Checkpointer on an existing client; MongoDB expires checkpoints after `ttl_seconds`"""
+    return CompactMongoDBSaver(
+        client,
+        db_name=db_name,
+        checkpoint_collection_name=collection_name,
+        writes_collection_name=f"{collection_name}_writes",
+        ttl=ttl_seconds,
+    )
@@ -0,0 +1,131 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent identical async calls.
+
+    The first caller for a key starts the coroutine as a task; callers arriving
+    while it is in flight await the same task and share its result (or
+    exception). Nothing is cached once the call finishes. The task is shielded,
+    so one caller going away does not cancel the work for everyone else.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+class _SharedStream:
+    """One upstream stream pumped by a background task into a shared buffer"""
+
+    def __init__(self, source, on_finished):
+        self.source = source
+        self.on_finished = on_finished
+        self.chunks = []
+        self.done = False
+        self.abandoned = False
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def start(self):
+        self.task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            async for chunk in self.source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Shared stream error: {e}")
+        finally:
+            self.on_finished()
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        # Wake every waiting subscriber, then arm a fresh event for the next chunk
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
+    def leave(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            # Last reader gone: stop paying for tokens nobody will read
+            self.abandoned = True
+            self.task.cancel()
+
+
+class Subscription:
+    """A reader attached to a shared stream.
+
+    Late subscribers first replay everything already received, then follow the
+    live stream. Cancelling a subscription only cancels upstream when it was
+    the last reader.
+    """
+
+    def __init__(self, shared: _SharedStream):
+        self._shared = shared
+        self.cancelled = False
+
+    async def __aiter__(self):
+        shared = self._shared
+        i = 0
+        while not self.cancelled:
+            if i < len(shared.chunks):
+                yield shared.chunks[i]
+                i += 1
+            elif shared.done:
+                return
+            else:
+                await shared.wait()
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self._shared.leave()
+
+
+class StreamFanout:
+    """Fan a single upstream token stream out to every identical request.
+
+    `subscribe(key, factory)` starts `factory()` only if no stream for `key` is
+    in flight; otherwise the caller attaches to the running one.
+    """
+
+    def __init__(self):
+        self._streams = {}
+        self.coalesced = 0
+
+    def subscribe(self, key: str, factory) -> Subscription:
+        shared = self._streams.get(key)
+        # A stream whose readers all left is being torn down; start afresh
+        if shared is not None and not shared.abandoned:
+            shared.subscribers += 1
+            self.coalesced += 1
+            return Subscription(shared)
+        shared = _SharedStream(factory(), lambda: self._finish(key, shared))
+        shared.subscribers = 1
+        self._streams[key] = shared
+        shared.start()
+        return Subscription(shared)
+
+    def _finish(self, key: str, shared: _SharedStream):
+        if self._streams.get(key) is shared:
+            del self._streams[key]
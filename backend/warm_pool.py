@@ -0,0 +1,406 @@
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+
+from backend.limited_process import MAX_OUTPUT_BYTES, SANDBOX_MAX_PROCESSES, limited_command, sandbox_popen_args
+
+
+# A long-lived Python zygote. Requests and replies are one JSON document per
+# line on private copies of the original stdin/stdout; fds 0-2 point at
+# /dev/null. Submissions never run in the zygote: each test input runs in a
+# child forked from it, with the common stdlib modules already imported, in
+# its own process group and with the protocol fds closed. The child's
+# stdout/stderr are pipes the zygote reads, so nothing a submission changes
+# (modules, builtins, open files) outlives its own run. Output past
+# "max_output" bytes or a run past its deadline kills the child; CPU time and
+# peak RSS come from the kernel's accounting of the child.
+PYTHON_WORKER = r"""
+import builtins, io, json, os, select, signal, sys, time
+import bisect, collections, decimal, fractions, functools, heapq, itertools, math, random, re, statistics, string
+try:
+    import resource
+except ImportError:
+    resource = None
+
+READ_CHUNK = 65536
+GRACE_SECONDS = 1
+TIMEOUT_EXIT = 124  # the child's exit status when its own deadline fired
+
+def run_child(program, stdin_text, limit, max_processes, closing, out_w, err_w):
+    # Runs in the forked child and never returns
+    code = 1
+    try:
+        os.setpgid(0, 0)
+        for fd in closing:
+            os.close(fd)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.close(out_w)
+        os.close(err_w)
+        sys.stdin = io.StringIO(stdin_text)
+        if resource is not None:
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (int(limit) + 1, hard))
+            # Per child, not on the zygote: the count is per user, and the zygote must keep forking
+            resource.setrlimit(resource.RLIMIT_NPROC, (max_processes, max_processes))
+        signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, limit)
+        note = ""
+        try:
+            exec(program, {"__name__": "__main__", "__builtins__": builtins})
+            code = 0
+        except SystemExit as e:
+            code = 0
+            if e.code not in (None, 0):
+                code = e.code if isinstance(e.code, int) else 1
+                note = f"SystemExit: {e.code}"
+        except BaseException as e:
+            if isinstance(e, TimeoutError):
+                code = TIMEOUT_EXIT
+                note = f"Code execution timed out after {limit} seconds"
+            else:
+                note = f"{type(e).__name__}: {e}"
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except BaseException:
+                pass
+        if note:
+            os.write(2, note.encode("utf-8", "replace"))
+    finally:
+        os._exit(code & 0xFF)
+
+def on_timeout(signum, frame):
+    raise TimeoutError("Code execution timed out")
+
+def run_one(program, stdin_text, request, protocol_fds):
+    limit, cap = request["timeout"], request["max_output"]
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    start = time.perf_counter()
+    try:
+        pid = os.fork()
+    except OSError as e:
+        for fd in (out_r, out_w, err_r, err_w):
+            os.close(fd)
+        return {"output": "", "error": f"Could not start the run: {e}", "exit_code": 1, "execution_time": 0}
+    if pid == 0:
+        run_child(program, stdin_text, limit, request["max_processes"], protocol_fds + [out_r, err_r], out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+    buffers = {out_r: bytearray(), err_r: bytearray()}
+    open_fds = [out_r, err_r]
+    deadline = start + limit + GRACE_SECONDS
+    status = rusage = None
+    killed = truncated = False
+    while open_fds:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            killed = True
+            break
+        ready, _, _ = select.select(open_fds, [], [], min(remaining, 0.05))
+        for fd in ready:
+            chunk = os.read(fd, READ_CHUNK)
+            if not chunk:
+                open_fds.remove(fd)
+                continue
+            buffers[fd] += chunk
+            if len(buffers[fd]) > cap:
+                del buffers[fd][cap:]
+                truncated = True
+        if truncated:
+            break
+        if status is None:
+            reaped, status, rusage = os.wait4(pid, os.WNOHANG)
+            if not reaped:
+                status = None
+            else:
+                # Stragglers it started may still hold the pipes open
+                kill_group(pid)
+    kill_group(pid)
+    if status is None:
+        _, status, rusage = os.wait4(pid, 0)
+    elapsed = time.perf_counter() - start
+    for fd in (out_r, err_r):
+        os.close(fd)
+
+    exit_code = os.waitstatus_to_exitcode(status)
+    # A submission can exit 124 itself, but not before its deadline
+    timed_out = killed or exit_code == -signal.SIGXCPU or (exit_code == TIMEOUT_EXIT and elapsed >= limit)
+    notes = []
+    if killed:
+        exit_code = -1
+        notes.append(f"Code execution timed out after {limit} seconds")
+    elif truncated:
+        exit_code = 1
+        notes.append("Output limit exceeded; output truncated")
+    elif exit_code == -signal.SIGXCPU:
+        notes.append(f"CPU time limit exceeded ({limit} seconds)")
+    elif exit_code < 0:
+        notes.append(f"Terminated by signal {signal.Signals(-exit_code).name}")
+    error = buffers[err_r].decode("utf-8", "replace")
+    return {
+        "output": buffers[out_r].decode("utf-8", "replace"),
+        "error": "\n".join(part for part in [error] + notes if part),
+        "exit_code": exit_code,
+        "execution_time": round(elapsed, 3),
+        "cpu_time": round(rusage.ru_utime + rusage.ru_stime, 3),
+        "max_rss": rusage.ru_maxrss,
+        "output_truncated": truncated,
+        "timed_out": timed_out,
+    }
+
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def _main():
+    requests = os.fdopen(os.dup(0), "r")
+    replies = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    protocol_fds = [requests.fileno(), replies.fileno()]
+
+    for line in requests:
+        request = json.loads(line)
+        try:
+            program = compile(request["code"], "<submission>", "exec")
+        except (SyntaxError, ValueError) as e:
+            results = [{"output": "", "error": f"{type(e).__name__}: {e}", "exit_code": 1, "execution_time": 0}
+                       for _ in request["inputs"]]
+        else:
+            results = [run_one(program, stdin_text, request, protocol_fds) for stdin_text in request["inputs"]]
+        replies.write(json.dumps(results) + "\n")
+        replies.flush()
+
+_main()
+"""
+
+
+# How long a worker that announced it is going away gets to exit on its own
+WORKER_EXIT_WAIT = 2
+
+
+class WorkerFailure(Exception):
+    """The worker timed out or died; it must not be reused"""
+
+
+class JsonLineCodec:
+    """Wire format of the Python worker: one JSON document per line each way"""
+
+    @staticmethod
+    def encode(payload: dict) -> str:
+        return json.dumps(payload)
+
+    @staticmethod
+    def decode(line: str, payload: dict):
+        """(reply, whether the worker can take another request)"""
+        return json.loads(line), True
+
+    @staticmethod
+    def exited(reply, payload: dict, returncode):
+        """Final reply from a worker that is going away, given its exit status (None if still running)"""
+        return reply
+
+
+class _Worker:
+    def __init__(self, argv: list, popen_args: dict = None):
+        self.runs = 0
+        self.proc = subprocess.Popen(
+            argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            cwd=tempfile.gettempdir(),
+            **(popen_args or {}),
+        )
+
+    def exchange(self, line: str, deadline: float) -> str:
+        """Send one request line and wait up to `deadline` seconds for the reply line"""
+        try:
+            self.proc.stdin.write(line + "\n")
+            self.proc.stdin.flush()
+            ready, _, _ = select.select([self.proc.stdout], [], [], deadline)
+            if not ready:
+                raise WorkerFailure("timed out")
+            reply = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerFailure(f"Sandbox worker crashed: {e}")
+        if not reply:
+            raise WorkerFailure("Sandbox worker crashed (resource limit exceeded?)")
+        return reply
+
+    def exit_status(self, timeout: float):
+        """The process's exit status once it exits within `timeout` seconds, else None"""
+        try:
+            return self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=1)
+        except Exception:
+            pass
+
+
+def failed_runs(error: WorkerFailure, inputs: list, timeout: int) -> list:
+    """Per-input results for a request the worker never answered"""
+    timed_out = str(error) == "timed out"
+    message = f"Code execution timed out after {timeout} seconds" if timed_out else str(error)
+    return [{"output": "", "error": message, "exit_code": -1, "execution_time": timeout, "timed_out": timed_out}
+            for _ in inputs]
+
+
+class WarmInterpreterPool:
+    """Pre-started interpreter processes that execute submissions over a pipe.
+
+    Each worker skips interpreter startup for every run after its first. A
+    worker is replaced after `max_runs` requests, and immediately after a
+    timeout, crash or a reply that says it is going away; replacements are
+    started in the background so callers rarely wait on a cold process. At
+    most `size` workers exist at once. `codec` maps request payloads to and
+    from the worker's line protocol.
+    """
+
+    def __init__(self, argv: list, size: int = 4, max_runs: int = 50, codec=JsonLineCodec, popen_args: dict = None):
+        self._argv = argv
+        self._popen_args = popen_args
+        self._size = size
+        self._max_runs = max_runs
+        self._codec = codec
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self.spawned = 0
+        self.recycled = 0
+        self.failures = 0
+        self.runs = 0
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._argv, self._popen_args)
+        with self._lock:
+            self.spawned += 1
+        return worker
+    def _spawn_idle(self):
+        try:
+            self._idle.put(self._spawn())
+        except Exception as e:
+            with self._lock:
+                self._live -= 1
+            print(f"Error starting sandbox worker: {e}")
+
+    def start(self):
+        """Pre-fork workers up to the pool size, in the background"""
+        with self._lock:
+            missing = self._size - self._live
+            self._live += missing
+        for _ in range(missing):
+            threading.Thread(target=self._spawn_idle, daemon=True).start()
+
+    def _acquire(self) -> _Worker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            grow = self._live < self._size
+            if grow:
+                self._live += 1
+        if grow:
+            try:
+                return self._spawn()
+            except Exception:
+                with self._lock:
+                    self._live -= 1
+                raise
+        return self._idle.get()
+
+    def _release(self, worker: _Worker, healthy: bool):
+        if healthy and worker.runs < self._max_runs:
+            self._idle.put(worker)
+            return
+        worker.kill()
+        with self._lock:
+            self.recycled += 1
+        threading.Thread(target=self._spawn_idle, daemon=True).start()
+
+    def request(self, payload: dict, deadline: float):
+        """Decoded reply for `payload`; raises WorkerFailure if the worker hung or died"""
+        worker = self._acquire()
+        reusable = False
+        try:
+            reply, reusable = self._codec.decode(worker.exchange(self._codec.encode(payload), deadline), payload)
+            if not reusable:
+                reply = self._codec.exited(reply, payload, worker.exit_status(WORKER_EXIT_WAIT))
+            return reply
+        except WorkerFailure:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            worker.runs += 1
+            with self._lock:
+                self.runs += 1
+            self._release(worker, reusable)
+
+    def run(self, code: str, inputs: list, timeout: int = 5) -> list:
+        """[{output, error, exit_code, execution_time, cpu_time, max_rss, output_truncated}] for each stdin"""
+        try:
+            return self.request(*python_request(code, inputs, timeout))
+        except WorkerFailure as e:
+            return failed_runs(e, inputs, timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self._live,
+                "idle": self._idle.qsize(),
+                "runs": self.runs,
+                "spawned": self.spawned,
+                "recycled": self.recycled,
+                "failures": self.failures,
+            }
+
+
+# Memory cap, no file writes, no core dumps; each run's CPU and process limits are set by the zygote
+# The interpreter must be runnable by SANDBOX_USER (e.g. /usr/bin/python3, not one under /root)
+SANDBOX_PYTHON = os.getenv("SANDBOX_PYTHON", sys.executable)
+PYTHON_WORKER_ARGV = limited_command([SANDBOX_PYTHON, "-I", "-c", PYTHON_WORKER], max_processes=None)
+# No server environment (API keys, Mongo URI) and, where possible, not the server's user
+PYTHON_WORKER_POPEN_ARGS = sandbox_popen_args(SANDBOX_PYTHON)
+
+
+def python_request(code: str, inputs: list, timeout: int):
+    """(payload, reply deadline) for the Python zygote"""
+    payload = {"code": code, "inputs": inputs, "timeout": timeout, "max_output": MAX_OUTPUT_BYTES,
+               "max_processes": SANDBOX_MAX_PROCESSES}
+    # The zygote kills each run a second past `timeout`; this is the backstop
+    return payload, (timeout + 1) * len(inputs) + 1
+
+
+def python_pool(size: int, max_runs: int) -> WarmInterpreterPool:
+    return WarmInterpreterPool(PYTHON_WORKER_ARGV, size=size, max_runs=max_runs, popen_args=PYTHON_WORKER_POPEN_ARGS)
+
+
+def run_python_once(code: str, inputs: list, timeout: int = 5) -> list:
+    """Same protocol on a throwaway worker (used when the warm pool is disabled)"""
+    worker = _Worker(PYTHON_WORKER_ARGV, PYTHON_WORKER_POPEN_ARGS)
+    payload, deadline = python_request(code, inputs, timeout)
+    try:
+        return json.loads(worker.exchange(JsonLineCodec.encode(payload), deadline))
+    except WorkerFailure as e:
+        return failed_runs(e, inputs, timeout)
+    finally:
+        worker.kill()
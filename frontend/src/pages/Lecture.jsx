@@ -136,6 +136,7 @@ const Lecture = () => {
     const streamAbortRef = useRef(null);
     const streamMetaRef = useRef(null);
     const streamContentRef = useRef("");
+    const threadIdRef = useRef(null); // latest thread id, readable from stream callbacks
     const streamingTimeoutRef = useRef(null);
     const streamingContentStateRef = useRef("");
     const lessonStreamStartedRef = useRef(false);
@@ -456,6 +457,7 @@ const Lecture = () => {
             // 🎯 FIXED: Generate unique thread_id for each new course search
             const uniqueThreadId = `course_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
             setCurrentThreadId(uniqueThreadId);
+            threadIdRef.current = uniqueThreadId;
             const response = await fetch("https://sih-backend-4fcb.onrender.com/course-stream", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
@@ -550,7 +552,8 @@ const Lecture = () => {
                 body: JSON.stringify({
                     topic: topic,
                     lesson_index: lessonIndex,
-                    lesson_title: lessonTitle
+                    lesson_title: lessonTitle,
+                    thread_id: threadIdRef.current
                 }),
                 signal: controller.signal
             });